@@ -35,6 +35,9 @@ __version__ = get_versions()['version']
 del get_versions
 from .pssh_client import ParallelSSHClient
 from .ssh_client import SSHClient
+from .retry import RetryPolicy
+from .circuit import CircuitBreaker
+from .resolver import Resolver
 from .utils import enable_host_logger
 from .exceptions import UnknownHostException, \
      AuthenticationException, ConnectionErrorException, SSHException
@@ -0,0 +1,151 @@
+# This file is part of parallel-ssh.
+
+# Copyright (C) 2014-2017 Panos Kittenis
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation, version 2.1.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Per host connection circuit breaker module of ParallelSSH"""
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+from .constants import DEFAULT_BREAKER_THRESHOLD, DEFAULT_BREAKER_COOLDOWN
+
+
+class CircuitBreaker(object):
+    """Skip connecting to hosts that repeatedly fail to connect.
+
+    After ``threshold`` consecutive connection failures of a host, its
+    circuit is opened and connection attempts to it fail immediately, without
+    retries, for ``cooldown`` seconds. After that, one connection attempt is
+    allowed through to probe the host. The circuit is closed again if the
+    probe succeeds and re-opened for another ``cooldown`` seconds if it
+    fails."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold=DEFAULT_BREAKER_THRESHOLD,
+                 cooldown=DEFAULT_BREAKER_COOLDOWN):
+        """
+        :param threshold: (Optional) Number of consecutive connection
+          failures of a host after which its circuit is opened. Defaults to 3.
+        :type threshold: int
+        :param cooldown: (Optional) Seconds to skip connecting to a host for
+          once its circuit is opened. Defaults to 60.
+        :type cooldown: float
+
+        **Example Usage**
+
+        .. code-block:: python
+
+          from pssh import ParallelSSHClient
+          from pssh.circuit import CircuitBreaker
+
+          client = ParallelSSHClient(
+              hosts, circuit_breaker=CircuitBreaker(threshold=2, cooldown=300))
+        """
+        if threshold < 1:
+            raise ValueError("Threshold must be at least one - got %s"
+                             % (threshold,))
+        if cooldown < 0:
+            raise ValueError("Cooldown must not be negative - got %s"
+                             % (cooldown,))
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = {}
+        self._opened = {}
+        self._probing = {}
+
+    def allow(self, host):
+        """Check whether a connection attempt to host should be made.
+
+        Once the cooldown of an open circuit has passed, the first call
+        returns ``True`` and moves the circuit to half open. Further calls
+        return ``False`` until that probe attempt is recorded as a success or
+        failure, or another ``cooldown`` seconds have passed.
+
+        :param host: Host to check
+        :type host: str
+        :rtype: bool"""
+        opened = self._opened.get(host)
+        if opened is None:
+            return True
+        now = monotonic()
+        if now - opened < self.cooldown:
+            return False
+        probing = self._probing.get(host)
+        if probing is not None and now - probing < self.cooldown:
+            return False
+        self._probing[host] = now
+        return True
+
+    def record_success(self, host):
+        """Record successful connection to host, closing its circuit.
+
+        :param host: Host connected to
+        :type host: str"""
+        self._failures.pop(host, None)
+        self._opened.pop(host, None)
+        self._probing.pop(host, None)
+
+    def record_failure(self, host):
+        """Record failed connection to host, opening its circuit if
+        ``threshold`` consecutive failures have been reached.
+
+        :param host: Host that failed to connect
+        :type host: str"""
+        self._probing.pop(host, None)
+        failures = self._failures.get(host, 0) + 1
+        self._failures[host] = failures
+        if failures >= self.threshold:
+            self._opened[host] = monotonic()
+
+    def failures(self, host):
+        """Number of consecutive connection failures of host.
+
+        :param host: Host to check
+        :type host: str
+        :rtype: int"""
+        return self._failures.get(host, 0)
+
+    def state(self, host):
+        """Current circuit state of host.
+
+        :param host: Host to check
+        :type host: str
+        :rtype: str - one of ``CircuitBreaker.CLOSED``,
+          ``CircuitBreaker.OPEN`` or ``CircuitBreaker.HALF_OPEN``"""
+        opened = self._opened.get(host)
+        if opened is None:
+            return self.CLOSED
+        if host in self._probing or monotonic() - opened >= self.cooldown:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def reset(self, host=None):
+        """Forget connection failures, closing circuits.
+
+        :param host: (Optional) Host to reset. Defaults to ``None`` for all
+          hosts
+        :type host: str"""
+        if host is None:
+            self._failures.clear()
+            self._opened.clear()
+            self._probing.clear()
+            return
+        self.record_success(host)
@@ -18,3 +18,14 @@
 """Constants definitions for pssh package"""
 
 DEFAULT_RETRIES = 3
+# Size of reads from SSH channel in raw output mode - maximum SSH packet size
+DEFAULT_CHUNK_SIZE = 32768
+DEFAULT_RETRY_DELAY = 1
+DEFAULT_RETRY_MULTIPLIER = 2
+DEFAULT_RETRY_MAX_DELAY = 30
+DEFAULT_RETRY_JITTER = 0.5
+DEFAULT_BREAKER_THRESHOLD = 3
+DEFAULT_BREAKER_COOLDOWN = 60
+DEFAULT_DNS_TTL = 300
+DEFAULT_DNS_NEGATIVE_TTL = 30
+DEFAULT_RESOLVER_POOL_SIZE = 100
@@ -42,3 +42,8 @@ class SSHException(Exception):
 class HostArgumentException(Exception):
     """Raised on errors with per-host command arguments"""
     pass
+
+
+class Timeout(Exception):
+    """Raised on timeout requested and reached"""
+    pass
@@ -0,0 +1,236 @@
+# This file is part of parallel-ssh.
+
+# Copyright (C) 2014-2017 Panos Kittenis
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation, version 2.1.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Event hooks module of ParallelSSH.
+
+Hooks are called by :py:class:`pssh.pssh_client.ParallelSSHClient` and
+:py:class:`pssh.ssh_client.SSHClient` on connection, command and file
+transfer events when provided with the ``hooks`` parameter. No hooks are
+called otherwise."""
+
+from gevent.lock import RLock
+
+
+class EventHooks(object):
+    """Base class for event hooks.
+
+    All hooks do nothing - sub-class and override the hooks of interest.
+    Hooks are called from the greenlet the event happens in and should not
+    block. Durations are in seconds."""
+
+    def connect_start(self, host, port):
+        """Called before connecting to host"""
+
+    def connect_end(self, host, port, duration, exception=None):
+        """Called after connecting and authenticating to host, including any
+        retries, has either succeeded or failed with ``exception``"""
+
+    def auth(self, host, port, success):
+        """Called with authentication result for host"""
+
+    def retry(self, host, port, attempt, delay, exception):
+        """Called when connection attempt number ``attempt`` has failed
+        with ``exception`` and will be retried in ``delay`` seconds"""
+
+    def channel_open(self, host, duration):
+        """Called after opening a channel to run a command on host"""
+
+    def bytes_read(self, host, stream, num_bytes):
+        """Called for output read from ``stream``, either ``stdout`` or
+        ``stderr``, of a command on host"""
+
+    def command_exit(self, host, exit_code, duration):
+        """Called when a command has exited on host. Duration is ``None`` if
+        not known"""
+
+    def file_transferred(self, host, local_file, remote_file, size,
+                         duration, direction):
+        """Called after a file of ``size`` bytes has been copied to, for
+        ``direction`` ``upload``, or from, for ``direction`` ``download``,
+        host"""
+
+
+class Histogram(object):
+    """Cumulative histogram of observed values"""
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                       10, 30, 60)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        """Add value to histogram"""
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MetricsHooks(EventHooks):
+    """Event hooks keeping in-memory counters and histograms of events.
+
+    **Example Usage**
+
+    .. code-block:: python
+
+      from pssh import ParallelSSHClient
+      from pssh.hooks import MetricsHooks
+
+      metrics = MetricsHooks()
+      client = ParallelSSHClient(hosts, hooks=metrics)
+      client.join(client.run_command('uname'))
+      print(metrics.counters[('pssh_connects_total', (('result', 'success'),))])
+      print(metrics.to_prometheus())
+
+    Metrics can be scraped by Prometheus by serving
+    :py:meth:`MetricsHooks.wsgi_app`, for example with
+    :py:class:`gevent.pywsgi.WSGIServer`
+
+    .. code-block:: python
+
+      from gevent.pywsgi import WSGIServer
+
+      WSGIServer(('', 9100), metrics.wsgi_app).start()
+    """
+
+    DESCRIPTIONS = {
+        'pssh_connects_total': ('counter', 'Host connections by result'),
+        'pssh_connect_duration_seconds': (
+            'histogram', 'Time to connect and authenticate to host'),
+        'pssh_auth_total': ('counter', 'Authentication attempts by result'),
+        'pssh_connect_retries_total': ('counter', 'Connection retries'),
+        'pssh_channel_open_duration_seconds': (
+            'histogram', 'Time to open command channel'),
+        'pssh_read_bytes_total': ('counter', 'Command output bytes read'),
+        'pssh_command_exits_total': ('counter',
+                                     'Commands exited by exit code'),
+        'pssh_command_duration_seconds': ('histogram',
+                                          'Command run time'),
+        'pssh_files_transferred_total': ('counter', 'Files transferred'),
+        'pssh_transferred_bytes_total': ('counter', 'File bytes transferred'),
+        'pssh_transfer_duration_seconds': ('histogram', 'File transfer time'),
+    }
+
+    def __init__(self, buckets=Histogram.DEFAULT_BUCKETS):
+        """
+        :param buckets: (Optional) Upper bounds of histogram buckets for
+          durations, in seconds
+        :type buckets: tuple(float)
+        """
+        self.buckets = buckets
+        # (name, labels) -> value where labels is a tuple of (name, value)
+        self.counters = {}
+        self.histograms = {}
+        self._lock = RLock()
+
+    def inc(self, name, value=1, **labels):
+        """Increment counter ``name`` with ``labels`` by ``value``"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Add ``value`` to histogram ``name`` with ``labels``"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            try:
+                histogram = self.histograms[key]
+            except KeyError:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def connect_end(self, host, port, duration, exception=None):
+        self.inc('pssh_connects_total',
+                 result='success' if exception is None else 'error')
+        if exception is None:
+            self.observe('pssh_connect_duration_seconds', duration)
+
+    def auth(self, host, port, success):
+        self.inc('pssh_auth_total',
+                 result='success' if success else 'failure')
+
+    def retry(self, host, port, attempt, delay, exception):
+        self.inc('pssh_connect_retries_total')
+
+    def channel_open(self, host, duration):
+        self.observe('pssh_channel_open_duration_seconds', duration)
+
+    def bytes_read(self, host, stream, num_bytes):
+        self.inc('pssh_read_bytes_total', num_bytes, stream=stream)
+
+    def command_exit(self, host, exit_code, duration):
+        self.inc('pssh_command_exits_total', exit_code=exit_code)
+        if duration is not None:
+            self.observe('pssh_command_duration_seconds', duration)
+
+    def file_transferred(self, host, local_file, remote_file, size,
+                         duration, direction):
+        self.inc('pssh_files_transferred_total', direction=direction)
+        self.inc('pssh_transferred_bytes_total', size, direction=direction)
+        self.observe('pssh_transfer_duration_seconds', duration,
+                     direction=direction)
+
+    def to_prometheus(self):
+        """Metrics in Prometheus text exposition format
+
+        :rtype: str"""
+        lines = []
+        with self._lock:
+            samples = {}
+            for (name, labels), value in self.counters.items():
+                samples.setdefault(name, []).append((name, labels, value))
+            for (name, labels), histogram in self.histograms.items():
+                _samples = samples.setdefault(name, [])
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    _samples.append((name + '_bucket',
+                                     labels + (('le', repr(float(bound))),),
+                                     count))
+                _samples.append((name + '_bucket', labels + (('le', '+Inf'),),
+                                 histogram.count))
+                _samples.append((name + '_sum', labels, histogram.sum))
+                _samples.append((name + '_count', labels, histogram.count))
+        for name in sorted(samples):
+            metric_type, description = self.DESCRIPTIONS.get(
+                name, ('untyped', name))
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s %s' % (name, metric_type))
+            for sample_name, labels, value in samples[name]:
+                lines.append('%s%s %s' % (
+                    sample_name, _format_labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+    def wsgi_app(self, environ, start_response):
+        """WSGI application serving metrics in Prometheus text format"""
+        body = self.to_prometheus().encode('utf-8')
+        start_response('200 OK', [
+            ('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+            ('Content-Length', str(len(body)))])
+        return [body]
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % (','.join(
+        '%s="%s"' % (name, str(value).replace('\\', r'\\').replace(
+            '"', r'\"').replace('\n', r'\n'))
+        for name, value in labels),)
@@ -20,17 +20,763 @@
 
 """Output module of ParallelSSH"""
 
+import heapq
+import io
+import json
+import mmap
+import os
+import pickle
+import tempfile
+from array import array
+from collections import deque
+from hashlib import sha1
 from os import linesep
 
+import gevent
+from gevent.event import Event
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-class HostOutput(dict):
-    """Class to hold host output"""
+from .constants import DEFAULT_CHUNK_SIZE
+
+
+class HostTiming(object):
+    """Monotonic clock timestamps of connection and command phases for a
+    host, as returned by :py:func:`time.monotonic`.
+
+    Timestamps of phases not reached, or not applicable, are ``None``.
+    Connection phases are only recorded for the first command run on a
+    connection and include any connection retries.
+
+    The ``auth`` phase covers both SSH key exchange and authentication.
+    ``first_byte`` is when output is first read from the channel, which is
+    as soon as it arrives when output is read in the background, as with
+    ``pump_output`` or ``retention``."""
+
+    __slots__ = ('start', 'resolved', 'connected', 'authenticated',
+                 'exec_started', 'channel_opened', 'command_sent',
+                 'first_byte', 'exited')
+
+    # Phase name, timestamps phase may start at in order of preference,
+    # timestamp phase ends at
+    PHASES = (
+        ('dns', ('start',), 'resolved'),
+        ('connect', ('resolved', 'start'), 'connected'),
+        ('auth', ('connected',), 'authenticated'),
+        ('channel_open', ('exec_started',), 'channel_opened'),
+        ('exec', ('channel_opened',), 'command_sent'),
+        ('first_byte', ('command_sent',), 'first_byte'),
+        ('command', ('command_sent',), 'exited'),
+    )
+
+    def __init__(self, **timestamps):
+        for name in self.__slots__:
+            setattr(self, name, timestamps.get(name))
+
+    def mark(self, name):
+        """Record current time as timestamp ``name`` if not already set"""
+        if getattr(self, name) is None:
+            setattr(self, name, monotonic())
+
+    def durations(self):
+        """Duration of each phase in seconds
+
+        :rtype: dict of phase name to duration or ``None`` if either
+          phase has not finished or did not take place"""
+        durations = {}
+        for phase, starts, end in self.PHASES:
+            _end = getattr(self, end)
+            _start = None
+            for start in starts:
+                _start = getattr(self, start)
+                if _start is not None:
+                    break
+            durations[phase] = _end - _start \
+                if _start is not None and _end is not None else None
+        return durations
+
+    def __repr__(self):
+        return "HostTiming(%s)" % (", ".join(
+            "%s=%.4f" % (phase, duration)
+            for phase, duration in sorted(self.durations().items())
+            if duration is not None),)
+
+
+def _percentile(values, percent):
+    """Nearest rank percentile of sorted list of values"""
+    index = max(int(round(percent / 100.0 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def timing_summary(timings, percentiles=(50, 90, 99)):
+    """Summarise durations of phases over many host timing records
+
+    :param timings: Host timing records
+    :type timings: iterable of :py:class:`HostTiming`
+    :param percentiles: Percentiles to calculate
+    :type percentiles: tuple(int)
+    :rtype: dict of phase name to dict of ``count``, ``min``, ``max``,
+      ``mean`` and ``p<N>`` per percentile, in seconds. Phases with no
+      durations are not included."""
+    phase_durations = {}
+    for timing in timings:
+        if timing is None:
+            continue
+        for phase, duration in timing.durations().items():
+            if duration is not None:
+                phase_durations.setdefault(phase, []).append(duration)
+    summary = {}
+    for phase, durations in phase_durations.items():
+        durations.sort()
+        stats = {'count': len(durations),
+                 'min': durations[0],
+                 'max': durations[-1],
+                 'mean': sum(durations) / len(durations)}
+        for percent in percentiles:
+            stats['p%s' % (percent,)] = _percentile(durations, percent)
+        summary[phase] = stats
+    return summary
+
+
+class OutputBuffer(object):
+    """Bounded buffer of a host's output filled from output generator by a
+    background greenlet, so that output is read from the SSH channel as soon
+    as it arrives regardless of whether or when it is iterated on.
+
+    Only retained items - lines, or chunks with raw output - are kept in
+    memory, as set by the buffer's retention policy. Other items are read
+    and discarded.
+
+    Iterating on buffer waits for all output to be read and then yields
+    retained items. Buffer may be iterated on more than once."""
+
+    def __init__(self, max_lines=None, max_bytes=None, keep='tail',
+                 encoding='utf-8'):
+        """
+        :param max_lines: (Optional) Maximum number of items to keep.
+          Defaults to ``None`` for no limit
+        :type max_lines: int
+        :param max_bytes: (Optional) Maximum total size in bytes of items to
+          keep. Defaults to ``None`` for no limit
+        :type max_bytes: int
+        :param keep: (Optional) Which items to keep when over limits -
+          ``tail`` for last items or ``head`` for first items, up to the
+          first item dropped. Defaults to ``tail``
+        :type keep: str
+        :param encoding: (Optional) Encoding of decoded lines, to count their
+          size in bytes with. Defaults to ``utf-8``
+        :type encoding: str
+        """
+        if keep not in ('head', 'tail'):
+            raise ValueError("Keep must be one of 'head' or 'tail' - got %s"
+                             % (keep,))
+        if max_lines is not None and max_lines < 1:
+            raise ValueError("Maximum lines must be at least one - got %s"
+                             % (max_lines,))
+        if max_bytes is not None and max_bytes < 0:
+            raise ValueError("Maximum bytes must not be negative - got %s"
+                             % (max_bytes,))
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.encoding = encoding
+        self.exception = None
+        # Total number and size in bytes of items read including those
+        # dropped
+        self.num_lines = 0
+        self.num_bytes = 0
+        self.dropped = 0
+        self._items = deque(maxlen=max_lines if keep == 'tail' else None)
+        self._size = 0
+        # Set once an item is dropped when keeping head of output, so that
+        # no later items are kept after it
+        self._full = False
+        self._done = Event()
+
+    def _item_size(self, item):
+        return len(item) if isinstance(item, bytes) \
+            else len(item.encode(self.encoding))
+
+    def append(self, item):
+        """Add item to buffer, dropping items as per retention policy"""
+        size = self._item_size(item)
+        self.num_lines += 1
+        self.num_bytes += size
+        if self.keep == 'head':
+            if self._full or (self.max_lines is not None
+                              and len(self._items) >= self.max_lines) \
+                    or (self.max_bytes is not None
+                        and self._size + size > self.max_bytes):
+                self._full = True
+                self.dropped += 1
+                return
+        elif self.max_lines is not None \
+                and len(self._items) == self.max_lines:
+            self._size -= self._item_size(self._items[0])
+            self.dropped += 1
+        self._items.append(item)
+        self._size += size
+        if self.max_bytes is not None:
+            while self._size > self.max_bytes:
+                self._size -= self._item_size(self._items.popleft())
+                self.dropped += 1
+
+    def fill(self, output):
+        """Read all of ``output`` into buffer. Exceptions reading output are
+        raised when buffer is iterated on.
+
+        :param output: Output generator to read from
+        :type output: iterable"""
+        try:
+            for item in output:
+                self.append(item)
+        except Exception as ex:
+            self.exception = ex
+        finally:
+            self._done.set()
+
+    @property
+    def done(self):
+        """Whether all output has been read"""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Wait for all output to be read
+
+        :rtype: bool - ``False`` on timeout"""
+        return self._done.wait(timeout=timeout)
+
+    def __iter__(self):
+        self._done.wait()
+        if self.exception is not None:
+            raise self.exception
+        return iter(list(self._items))
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return "<%s keep=%s lines=%s dropped=%s done=%s>" % (
+            self.__class__.__name__, self.keep, len(self._items),
+            self.dropped, self.done)
+
+
+class StreamBuffer(object):
+    """Buffer of all of a host's output filled from output generator by a
+    background greenlet.
+
+    Unlike :py:class:`OutputBuffer`, iterating on buffer yields output as it
+    arrives without waiting for all of it to be read first. Buffer may be
+    iterated on more than once, and by more than one greenlet at a time.
+    All output is kept in memory."""
+
+    def __init__(self):
+        self.exception = None
+        self.num_bytes = 0
+        self._items = []
+        self._done = Event()
+        self._new_data = Event()
+        self._waiters = 0
+
+    def _notify(self):
+        # New event per wake up so that all readers waiting on previous one
+        # are woken regardless of order they run in
+        if self._waiters:
+            new_data, self._new_data = self._new_data, Event()
+            new_data.set()
+
+    def append(self, item):
+        """Add item to buffer and wake up any waiting readers"""
+        self._items.append(item)
+        self.num_bytes += len(item)
+        self._notify()
+
+    def fill(self, output):
+        """Read all of ``output`` into buffer. Exceptions reading output are
+        raised when iterating on buffer reaches them.
+
+        :param output: Output generator to read from
+        :type output: iterable"""
+        try:
+            for item in output:
+                self.append(item)
+        except Exception as ex:
+            self.exception = ex
+        finally:
+            self._done.set()
+            self._notify()
+
+    @property
+    def done(self):
+        """Whether all output has been read"""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Wait for all output to be read
+
+        :rtype: bool - ``False`` on timeout"""
+        return self._done.wait(timeout=timeout)
+
+    def __iter__(self):
+        i = 0
+        while True:
+            if i < len(self._items):
+                yield self._items[i]
+                i += 1
+                continue
+            if self.done:
+                break
+            self._waiters += 1
+            try:
+                self._new_data.wait()
+            finally:
+                self._waiters -= 1
+        if self.exception is not None:
+            raise self.exception
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return "<%s lines=%s done=%s>" % (
+            self.__class__.__name__, len(self._items), self.done)
+
+
+class Retention(object):
+    """Output retention policy - how much of each host's output to keep in
+    memory.
+
+    **Example Usage**
+
+    .. code-block:: python
+
+      from pssh.output import Retention
+
+      # Last 200 lines of each host's stdout and stderr
+      output = client.run_command('dmesg', retention=Retention(lines=200))
+      for line in output['myhost'].stdout:
+          print(line)
+    """
+
+    def __init__(self, lines=None, max_bytes=None, keep='tail'):
+        """
+        :param lines: (Optional) Number of lines to keep per host and stream.
+          Defaults to ``None`` for no limit
+        :type lines: int
+        :param max_bytes: (Optional) Maximum total size in bytes of lines to
+          keep per host and stream, as encoded with the command's output
+          encoding. Defaults to ``None`` for no limit
+        :type max_bytes: int
+        :param keep: (Optional) ``tail`` to keep last lines or ``head`` to
+          keep first lines. Defaults to ``tail``
+        :type keep: str
+        """
+        if keep not in ('head', 'tail'):
+            raise ValueError("Keep must be one of 'head' or 'tail' - got %s"
+                             % (keep,))
+        if lines is not None and lines < 1:
+            raise ValueError("Lines must be at least one - got %s"
+                             % (lines,))
+        if max_bytes is not None and max_bytes < 0:
+            raise ValueError("Maximum bytes must not be negative - got %s"
+                             % (max_bytes,))
+        self.lines = lines
+        self.max_bytes = max_bytes
+        self.keep = keep
+
+    def make_buffer(self, encoding='utf-8'):
+        """Make a new output buffer with this policy
+
+        :param encoding: (Optional) Encoding of decoded lines buffer is to
+          hold. Defaults to ``utf-8``
+        :type encoding: str
+        :rtype: :py:class:`OutputBuffer`"""
+        return OutputBuffer(max_lines=self.lines, max_bytes=self.max_bytes,
+                            encoding=encoding,
+                            keep=self.keep)
+
+
+class SpoolFile(object):
+    """Host output spooled to a file on disk as it arrives.
+
+    Output is written as raw bytes as read from the SSH channel and only
+    ever held in memory one chunk at a time. Once all output has been read,
+    it can be accessed without copying via a memory mapped view of the file
+    or iterated on line by line.
+
+    The file is opened for each chunk written rather than kept open, so that
+    output of any number of hosts can be spooled without running out of file
+    descriptors."""
+
+    def __init__(self, path, encoding='utf-8'):
+        """
+        :param path: File path to spool output to. Existing file is
+          truncated
+        :type path: str
+        :param encoding: (Optional) Encoding to decode lines with when
+          iterating on spooled output
+        :type encoding: str
+        """
+        self.path = path
+        self.encoding = encoding
+        self.exception = None
+        self.num_bytes = 0
+        self._done = Event()
+        open(self.path, 'wb').close()
+
+    def fill(self, output):
+        """Write all of ``output`` to spool file. Exceptions reading output
+        are raised when spooled output is accessed.
+
+        :param output: Raw output chunks to write
+        :type output: iterable of bytes"""
+        try:
+            for chunk in output:
+                with open(self.path, 'ab') as fh:
+                    fh.write(chunk)
+                self.num_bytes += len(chunk)
+        except Exception as ex:
+            self.exception = ex
+        finally:
+            self._done.set()
+
+    @property
+    def done(self):
+        """Whether all output has been spooled"""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Wait for all output to be spooled
+
+        :rtype: bool - ``False`` on timeout"""
+        return self._done.wait(timeout=timeout)
+
+    def _wait(self):
+        self._done.wait()
+        if self.exception is not None:
+            raise self.exception
+
+    def mmap(self):
+        """Memory map of spooled output, after waiting for all output to be
+        spooled.
+
+        :rtype: :py:class:`mmap.mmap` or ``None`` if there is no output"""
+        self._wait()
+        if not self.num_bytes:
+            return
+        with open(self.path, 'rb') as fh:
+            return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def view(self):
+        """Zero-copy view of spooled output, after waiting for all output to
+        be spooled.
+
+        :rtype: :py:class:`memoryview`"""
+        _mmap = self.mmap()
+        return memoryview(_mmap) if _mmap is not None else memoryview(b'')
+
+    def iter_lines(self, keepends=False):
+        """Iterate on raw lines of spooled output, after waiting for all
+        output to be spooled.
+
+        :param keepends: (Optional) Keep line endings. Defaults to ``False``
+        :type keepends: bool
+        :rtype: generator of bytes"""
+        _mmap = self.mmap()
+        if _mmap is None:
+            return
+        try:
+            for line in iter(_mmap.readline, b''):
+                yield line if keepends else line.rstrip(b'\r\n')
+        finally:
+            _mmap.close()
+
+    def __iter__(self):
+        for line in self.iter_lines():
+            yield line.decode(self.encoding)
+
+    def __repr__(self):
+        return "<%s path=%s bytes=%s done=%s>" % (
+            self.__class__.__name__, self.path, self.num_bytes, self.done)
+
+
+class OutputGroup(object):
+    """Group of hosts with identical output"""
+
+    __slots__ = ('digest', 'hosts', 'stdout', 'stderr')
+
+    def __init__(self, digest, hosts, stdout, stderr):
+        """
+        :param digest: Hex digest of output
+        :type digest: str
+        :param hosts: Hosts in group
+        :type hosts: list(str)
+        :param stdout: Standard output of hosts in group - one copy
+        :type stdout: list
+        :param stderr: Standard error of hosts in group - one copy
+        :type stderr: list
+        """
+        self.digest = digest
+        self.hosts = hosts
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def __repr__(self):
+        return "<%s digest=%s hosts=%s>" % (
+            self.__class__.__name__, self.digest, self.hosts)
+
+
+class _OutputSpool(object):
+    """Temporary file to hold output items read while their group is not yet
+    known, so that they are only kept in memory if they turn out to be the
+    first copy of a group.
+
+    Items are written in batches of up to ``DEFAULT_CHUNK_SIZE`` and the
+    file is opened for each batch written rather than kept open."""
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(prefix='pssh-group-')
+        os.close(fd)
+        self._pending = []
+        self._pending_size = 0
+
+    def append(self, item):
+        self._pending.append(item)
+        self._pending_size += len(item)
+        if self._pending_size >= DEFAULT_CHUNK_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        with open(self.path, 'ab') as fh:
+            pickle.dump(self._pending, fh, pickle.HIGHEST_PROTOCOL)
+        self._pending = []
+        self._pending_size = 0
+
+    def load(self):
+        """Read all items back from spool file"""
+        self._flush()
+        items = []
+        with open(self.path, 'rb') as fh:
+            while True:
+                try:
+                    items.extend(pickle.load(fh))
+                except EOFError:
+                    return items
+
+    def remove(self):
+        self._pending = []
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _hash_output(_hash, output_buffer, spool):
+    """Update hash with all of output, writing items to spool"""
+    if output_buffer is None:
+        return
+    for item in output_buffer:
+        if isinstance(item, bytes):
+            _hash.update(item)
+        else:
+            _hash.update(item.encode('utf-8') + b'\n')
+        spool.append(item)
+
+
+def _group_host_output(host, host_output, groups):
+    """Hash host's output and add host to its group in ``groups``, loading
+    output from spool only if host is first in group"""
+    _hash = sha1()
+    stdout, stderr = _OutputSpool(), _OutputSpool()
+    try:
+        _hash_output(_hash, host_output.stdout, stdout)
+        # Separate stdout from stderr so output moving between them is
+        # different
+        _hash.update(b'\0')
+        _hash_output(_hash, host_output.stderr, stderr)
+        digest = _hash.hexdigest()
+        if digest in groups:
+            groups[digest].hosts.append(host)
+            return
+        groups[digest] = OutputGroup(digest, [host], stdout.load(),
+                                     stderr.load())
+    finally:
+        stdout.remove()
+        stderr.remove()
+
+
+def group_output(output):
+    """Group hosts by identical standard output and error, in the style of
+    ``dshbak -c``.
+
+    Output of all hosts is read concurrently and hashed as it is read. While
+    reading, output is spooled to temporary files rather than kept in memory
+    - only the output of the first host of each group is read back into
+    memory once its digest is known and spooled output of other hosts is
+    discarded. Hosts with exceptions are not included.
+
+    Output buffers are consumed - use with output that can be iterated on
+    more than once, like that of ``retention`` or ``spool_dir`` on
+    :py:func:`pssh.pssh_client.ParallelSSHClient.run_command`, to also read
+    it afterwards.
+
+    :param output: As returned by
+      :py:func:`pssh.pssh_client.ParallelSSHClient.run_command`
+    :type output: dict
+    :rtype: list(:py:class:`OutputGroup`) in descending order of number of
+      hosts"""
+    groups = {}
+    gevent.joinall([
+        gevent.spawn(_group_host_output, host, output[host], groups)
+        for host in output if output[host].exception is None],
+        raise_error=True)
+    return sorted(groups.values(), key=lambda group: len(group.hosts),
+                  reverse=True)
+
+
+class JSONLinesWriter(object):
+    """Write results of commands as JSON lines, one object per host.
+
+    Each object has ``host``, ``exit_code``, ``exception`` - ``None`` or an
+    object with exception ``type`` and ``message`` - and ``timing`` with
+    durations of connection and command phases as per
+    :py:func:`HostTiming.durations`. Output is included as ``stdout`` and
+    ``stderr`` lists, or with ``output='digest'`` as ``stdout_digest`` and
+    ``stderr_digest`` objects with ``sha1``, ``lines`` and ``bytes`` of
+    output, or not at all with ``output=None``.
+
+    Objects are written as soon as each host is written, so only one host's
+    output is held in memory at a time, and not even that with digests."""
+
+    OUTPUT_LINES = 'lines'
+    OUTPUT_DIGEST = 'digest'
+
+    def __init__(self, fh, output=OUTPUT_LINES, flush=True):
+        """
+        :param fh: File object or file descriptor to write to. File
+          descriptors are not closed by the writer
+        :type fh: file or int
+        :param output: (Optional) How to include output - ``lines``,
+          ``digest`` or ``None``. Defaults to ``lines``
+        :type output: str
+        :param flush: (Optional) Flush after each host. Defaults to ``True``
+        :type flush: bool
+        :raises: :py:class:`ValueError` on unknown output option
+        """
+        if output not in (self.OUTPUT_LINES, self.OUTPUT_DIGEST, None):
+            raise ValueError("Unknown output option %s" % (output,))
+        if isinstance(fh, int):
+            fh = io.open(fh, 'w', encoding='utf-8', closefd=False)
+        self.fh = fh
+        self.output = output
+        self.flush = flush
+        self.num_hosts = 0
+
+    def write(self, host_output):
+        """Write result of host output, reading its output buffers to
+        completion if output is included.
+
+        :param host_output: Output of host to write
+        :type host_output: :py:class:`HostOutput`"""
+        result = {
+            'host': host_output.host,
+            'exit_code': host_output.exit_code,
+            'exception': None if host_output.exception is None else {
+                'type': host_output.exception.__class__.__name__,
+                'message': _format_exception(host_output.exception)},
+            'timing': None if host_output.timing is None
+            else host_output.timing.durations(),
+        }
+        for stream in ('stdout', 'stderr'):
+            output_buffer = getattr(host_output, stream)
+            if self.output == self.OUTPUT_LINES:
+                result[stream] = [_decode(item) for item in output_buffer] \
+                    if output_buffer is not None else None
+            elif self.output == self.OUTPUT_DIGEST:
+                result[stream + '_digest'] = _digest(output_buffer) \
+                    if output_buffer is not None else None
+        line = json.dumps(result, sort_keys=True)
+        if not isinstance(line, type(u'')):
+            line = line.decode('utf-8')
+        self.fh.write(line + u'\n')
+        if self.flush:
+            self.fh.flush()
+        self.num_hosts += 1
+
+    def write_all(self, host_outputs):
+        """Write results of all host output in iterable as each becomes
+        available, for example from
+        :py:func:`pssh.pssh_client.ParallelSSHClient.as_completed`.
+
+        :param host_outputs: Host output to write
+        :type host_outputs: iterable of :py:class:`HostOutput`
+        :rtype: int - number of hosts written"""
+        num_hosts = self.num_hosts
+        for host_output in host_outputs:
+            self.write(host_output)
+        return self.num_hosts - num_hosts
+
+
+def _format_exception(ex):
+    """Exception message, formatting logging style arguments of pssh
+    exceptions like ``("Error connecting to host '%s:%s'", host, port)``"""
+    if len(ex.args) > 1 and isinstance(ex.args[0], (str, type(u''))):
+        try:
+            return ex.args[0] % ex.args[1:]
+        except (TypeError, ValueError):
+            # Message already formatted, with extra arguments
+            return ex.args[0]
+    return str(ex)
+
+
+def _decode(item):
+    return item.decode('utf-8', 'replace') if isinstance(item, bytes) \
+        else item
+
+
+def _digest(output_buffer):
+    """Hash output as it is read without keeping it"""
+    _hash = sha1()
+    num_lines = num_bytes = 0
+    for item in output_buffer:
+        if not isinstance(item, bytes):
+            item = item.encode('utf-8') + b'\n'
+        _hash.update(item)
+        num_lines += item.count(b'\n')
+        num_bytes += len(item)
+    return {'sha1': _hash.hexdigest(), 'lines': num_lines,
+            'bytes': num_bytes}
+
+
+class HostOutput(object):
+    """Class to hold host output
+
+    Fields are only stored as attributes. Host output is also a mapping of
+    field names to values for compatibility with ``dict`` access like
+    ``host_output['exit_code']``.
+
+    Mapping methods are implemented directly rather than inherited from
+    :py:class:`collections.Mapping`, which on Python 2 gives instances a
+    ``__dict__`` despite ``__slots__``. Host output is registered as a
+    virtual subclass of it instead."""
 
     __slots__ = ('host', 'cmd', 'channel', 'stdout', 'stderr', 'stdin',
-                 'exit_code', 'exception')
+                 'exit_code', 'exception', 'timing')
 
     def __init__(self, host, cmd, channel, stdout, stderr, stdin,
-                 exit_code=None, exception=None):
+                 exit_code=None, exception=None, timing=None):
         """
         :param host: Host name output is for
         :type host: str
@@ -48,11 +794,9 @@ class HostOutput(dict):
         :type exit_code: int or None
         :param exception: Exception from host if any
         :type exception: :py:class:`Exception` or ``None``
+        :param timing: Timestamps of connection and command phases
+        :type timing: :py:class:`HostTiming` or ``None``
         """
-        dict.__init__(self, (('host', host), ('cmd', cmd), ('channel', channel),
-                             ('stdout', stdout), ('stderr', stderr),
-                             ('stdin', stdin), ('exit_code', exit_code),
-                             ('exception', exception)))
         self.host = host
         self.cmd = cmd
         self.channel = channel
@@ -61,16 +805,57 @@ class HostOutput(dict):
         self.stdin = stdin
         self.exception = exception
         self.exit_code = exit_code
+        self.timing = timing
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
 
-    def __setattr__(self, name, value):
-        object.__setattr__(self, name, value)
-        dict.__setitem__(self, name, value)
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def keys(self):
+        return list(self.__slots__)
+
+    def values(self):
+        return [getattr(self, key) for key in self.__slots__]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.__slots__]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
 
     def update(self, update_dict):
-        """Override of dict update function for backwards compatibility"""
-        dict.update(self, update_dict)
+        """Set fields from dictionary, for backwards compatibility"""
         for key in update_dict:
-            object.__setattr__(self, key, update_dict[key])
+            self[key] = update_dict[key]
 
     def __repr__(self):
         return "{linesep}\thost={host}{linesep}" \
@@ -78,8 +863,244 @@ class HostOutput(dict):
             "\tcmd={cmd}{linesep}\tchannel={channel}{linesep}" \
             "\tstdout={stdout}{linesep}\tstderr={stderr}{linesep}" \
             "\tstdin={stdin}{linesep}" \
-            "\texception={exception}{linesep}".format(
+            "\texception={exception}{linesep}" \
+            "\ttiming={timing}{linesep}".format(
                 host=self.host, cmd=self.cmd, channel=self.channel,
                 stdout=self.stdout, stdin=self.stdin, stderr=self.stderr,
                 exception=self.exception, linesep=linesep,
-                exit_code=self.exit_code)
+                exit_code=self.exit_code, timing=self.timing)
+
+
+Mapping.register(HostOutput)
+
+
+class ConnectResult(object):
+    """Result of connecting to a host ahead of running commands"""
+
+    __slots__ = ('host', 'exception', 'timing')
+
+    def __init__(self, host, exception=None, timing=None):
+        """
+        :param host: Host name
+        :type host: str
+        :param exception: Exception connecting to host if any
+        :type exception: :py:class:`Exception` or ``None``
+        :param timing: Timestamps of connection phases, ``None`` if host was
+          already connected or on exception
+        :type timing: :py:class:`HostTiming` or ``None``
+        """
+        self.host = host
+        self.exception = exception
+        self.timing = timing
+
+    @property
+    def connected(self):
+        """Whether host is connected and authenticated"""
+        return self.exception is None
+
+    def __repr__(self):
+        return "<%s host=%s connected=%s exception=%r>" % (
+            self.__class__.__name__, self.host, self.connected,
+            self.exception)
+
+
+class RunResult(object):
+    """Columnar results of a command run on many hosts.
+
+    Exit codes and durations of connection and command phases of all hosts
+    are stored in typed arrays indexed by host position in ``hosts``, which
+    takes a fraction of the memory of keeping host output objects around.
+    Exceptions are kept only for hosts that have one.
+
+    Exit codes not available are stored as ``NO_EXIT_CODE`` and durations not
+    available as ``NaN``.
+
+    Columns are NumPy arrays if NumPy is installed, making summary
+    statistics vectorised operations, and :py:class:`array.array` otherwise.
+    """
+
+    __slots__ = ('hosts', 'exit_codes', 'durations', 'exceptions', '_index')
+
+    NO_EXIT_CODE = -1
+
+    def __init__(self, hosts, exit_codes, durations, exceptions=None):
+        """
+        :param hosts: Host names
+        :type hosts: list(str)
+        :param exit_codes: Exit code of each host
+        :type exit_codes: :py:class:`array.array` or
+          :py:class:`numpy.ndarray`
+        :param durations: Phase name to array of duration of phase for each
+          host
+        :type durations: dict
+        :param exceptions: (Optional) Host index to exception for hosts with
+          exceptions
+        :type exceptions: dict
+        """
+        self.hosts = hosts
+        self.exit_codes = exit_codes
+        self.durations = durations
+        self.exceptions = exceptions if exceptions is not None else {}
+        self._index = None
+
+    @classmethod
+    def from_output(cls, output):
+        """Make run result from output of
+        :py:func:`pssh.pssh_client.ParallelSSHClient.run_command`.
+
+        Exit codes are as currently set in output - call
+        :py:func:`pssh.pssh_client.ParallelSSHClient.join` first to wait for
+        all commands to finish.
+
+        :param output: Output to make result from
+        :type output: dict or iterable of :py:class:`HostOutput`
+        :rtype: :py:class:`RunResult`"""
+        host_outputs = output.values() if isinstance(output, dict) \
+            else output
+        hosts = []
+        exit_codes = array('i')
+        durations = dict((phase, array('d'))
+                         for phase, _, _ in HostTiming.PHASES)
+        exceptions = {}
+        nan = float('nan')
+        for i, host_output in enumerate(host_outputs):
+            hosts.append(host_output.host)
+            exit_codes.append(cls.NO_EXIT_CODE if host_output.exit_code
+                              is None else host_output.exit_code)
+            if host_output.exception is not None:
+                exceptions[i] = host_output.exception
+            _durations = host_output.timing.durations() \
+                if host_output.timing is not None else {}
+            for phase, values in durations.items():
+                duration = _durations.get(phase)
+                values.append(nan if duration is None else duration)
+        if numpy is not None:
+            exit_codes = numpy.frombuffer(exit_codes, dtype=numpy.intc)
+            durations = dict(
+                (phase, numpy.frombuffer(values, dtype=numpy.float64))
+                for phase, values in durations.items())
+        return cls(hosts, exit_codes, durations, exceptions)
+
+    def _host_index(self, host):
+        if self._index is None:
+            self._index = dict((_host, i) for i, _host
+                               in enumerate(self.hosts))
+        return self._index[host]
+
+    def exit_code(self, host):
+        """Exit code of host
+
+        :rtype: int or ``None`` if not available
+        :raises: :py:class:`KeyError` on host not in result"""
+        exit_code = int(self.exit_codes[self._host_index(host)])
+        return None if exit_code == self.NO_EXIT_CODE else exit_code
+
+    def exception(self, host):
+        """Exception of host, if any
+
+        :raises: :py:class:`KeyError` on host not in result"""
+        return self.exceptions.get(self._host_index(host))
+
+    def duration(self, host, phase):
+        """Duration of phase for host, as per :py:func:`HostTiming.durations`
+
+        :rtype: float or ``None`` if not available
+        :raises: :py:class:`KeyError` on host not in result or unknown
+          phase"""
+        duration = float(self.durations[phase][self._host_index(host)])
+        return None if duration != duration else duration
+
+    def _is_numpy(self):
+        return numpy is not None and isinstance(self.exit_codes,
+                                                numpy.ndarray)
+
+    def failed_hosts(self):
+        """Hosts with an exception or non-zero exit code
+
+        :rtype: list(str)"""
+        if self._is_numpy():
+            failed = (self.exit_codes != 0) & \
+                (self.exit_codes != self.NO_EXIT_CODE)
+            if self.exceptions:
+                failed[list(self.exceptions)] = True
+            return [self.hosts[i] for i in numpy.flatnonzero(failed)]
+        return [host for i, host in enumerate(self.hosts)
+                if i in self.exceptions or self.exit_codes[i] not in (
+                    0, self.NO_EXIT_CODE)]
+
+    def exit_code_histogram(self):
+        """Number of hosts per exit code
+
+        :rtype: dict of exit code, or ``None`` for hosts without an exit
+          code, to number of hosts"""
+        if self._is_numpy():
+            codes, counts = numpy.unique(self.exit_codes, return_counts=True)
+            histogram = dict(zip(codes.tolist(), counts.tolist()))
+        else:
+            histogram = {}
+            for exit_code in self.exit_codes:
+                histogram[exit_code] = histogram.get(exit_code, 0) + 1
+        if self.NO_EXIT_CODE in histogram:
+            histogram[None] = histogram.pop(self.NO_EXIT_CODE)
+        return histogram
+
+    def exception_counts(self):
+        """Number of hosts per exception type
+
+        :rtype: dict of exception class name to number of hosts"""
+        counts = {}
+        for exception in self.exceptions.values():
+            name = exception.__class__.__name__
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def _sorted_durations(self, phase):
+        durations = self.durations[phase]
+        if self._is_numpy():
+            return numpy.sort(durations[~numpy.isnan(durations)])
+        return sorted(d for d in durations if d == d)
+
+    def percentiles(self, phase='command', percentiles=(50, 95, 99)):
+        """Nearest rank percentiles of duration of phase over all hosts with
+        a duration for that phase
+
+        :param phase: (Optional) Phase name as per
+          :py:attr:`HostTiming.PHASES`. Defaults to ``command``
+        :type phase: str
+        :param percentiles: (Optional) Percentiles to calculate
+        :type percentiles: tuple(int)
+        :rtype: dict of ``p<percentile>`` to duration, or empty dict if no
+          hosts have a duration for the phase"""
+        durations = self._sorted_durations(phase)
+        if not len(durations):
+            return {}
+        return dict(('p%s' % (percent,),
+                     float(_percentile(durations, percent)))
+                    for percent in percentiles)
+
+    def slowest(self, num_hosts=10, phase='command'):
+        """Hosts with longest duration of phase
+
+        :param num_hosts: (Optional) Number of hosts to return
+        :type num_hosts: int
+        :param phase: (Optional) Phase name. Defaults to ``command``
+        :type phase: str
+        :rtype: list of (host, duration) tuples, slowest first"""
+        durations = self.durations[phase]
+        if self._is_numpy():
+            valid = numpy.flatnonzero(~numpy.isnan(durations))
+            order = valid[numpy.argsort(-durations[valid],
+                                        kind='stable')][:num_hosts]
+            return [(self.hosts[i], float(durations[i])) for i in order]
+        slowest = heapq.nlargest(
+            num_hosts, (i for i, d in enumerate(durations) if d == d),
+            key=durations.__getitem__)
+        return [(self.hosts[i], durations[i]) for i in slowest]
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def __repr__(self):
+        return "<%s hosts=%s failed=%s>" % (
+            self.__class__.__name__, len(self.hosts),
+            len(self.failed_hosts()))
@@ -0,0 +1,307 @@
+# This file is part of parallel-ssh.
+
+# Copyright (C) 2014-2017 Panos Kittenis
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation, version 2.1.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Greenlet pool module of ParallelSSH"""
+
+import logging
+from collections import deque
+from contextlib import contextmanager
+from time import time
+
+import gevent
+import gevent.pool
+
+
+logger = logging.getLogger(__name__)
+
+
+class Pool(gevent.pool.Pool):
+    """:py:class:`gevent.pool.Pool` where greenlets can give up their pool
+    slot while idle.
+
+    Pool size limits how many greenlets are actively connecting to,
+    authenticating with or running commands on hosts. Greenlets waiting on
+    something other than a host - connection retry delays, a shared proxy
+    host connection being made - release their slot while doing so, letting
+    greenlets for other hosts use it, and take a slot again when done."""
+
+    def __init__(self, size=None, greenlet_class=None):
+        gevent.pool.Pool.__init__(self, size=size,
+                                  greenlet_class=greenlet_class)
+        self._queued = 0
+        self._idle = 0
+        # Greenlets in pool not holding a slot - idle or waiting for a slot
+        # to resume
+        self._slotless = set()
+        # Slots to remove from semaphore as they are released after shrinking
+        self._debt = 0
+
+    @property
+    def queue_depth(self):
+        """Number of greenlets waiting for a pool slot - both those waiting
+        to be spawned and idle greenlets waiting to resume"""
+        return self._queued
+
+    @property
+    def num_idle(self):
+        """Number of greenlets in pool that have given up their slot while
+        idle"""
+        return self._idle
+
+    def resize(self, size):
+        """Change pool size.
+
+        Greenlets already running are not interrupted - when shrinking, pool
+        slots are removed as running greenlets finish or go idle.
+
+        :param size: New pool size
+        :type size: int"""
+        if self.size is None or size is None or size < 0:
+            raise ValueError("Can only resize pools with a size - got %s -> %s"
+                             % (self.size, size,))
+        diff = size - self.size
+        self.size = size
+        while diff > 0 and self._debt:
+            self._debt -= 1
+            diff -= 1
+        for _ in range(diff):
+            self._semaphore.release()
+        while diff < 0:
+            if not self._semaphore.acquire(blocking=False):
+                self._debt -= diff
+                break
+            diff += 1
+
+    def _release_slot(self):
+        if self._debt:
+            self._debt -= 1
+            return
+        self._semaphore.release()
+
+    def _discard(self, greenlet):
+        gevent.pool.Group._discard(self, greenlet)
+        if greenlet in self._slotless:
+            self._slotless.discard(greenlet)
+            return
+        self._release_slot()
+
+    def free_count(self):
+        """Number of greenlets that can be added to pool without waiting.
+        Greenlets that have given up their slot while idle are not counted
+        as using one"""
+        if self.size is None:
+            return 1
+        return max(0, self.size - (len(self) - len(self._slotless)))
+
+    def add(self, greenlet, *args, **kwargs):
+        self._queued += 1
+        try:
+            return gevent.pool.Pool.add(self, greenlet, *args, **kwargs)
+        finally:
+            self._queued -= 1
+
+    @contextmanager
+    def idle(self):
+        """Context manager that releases the current greenlet's pool slot for
+        the duration of the block and waits for a free slot again on exit.
+
+        Does nothing if the current greenlet was not spawned by this pool.
+
+        **Example Usage**
+
+        .. code-block:: python
+
+          with pool.idle():
+              gevent.sleep(5)
+        """
+        current = gevent.getcurrent()
+        if current not in self.greenlets:
+            yield
+            return
+        self._release_slot()
+        self._slotless.add(current)
+        self._idle += 1
+        try:
+            yield
+        finally:
+            self._idle -= 1
+            self._queued += 1
+            try:
+                self._semaphore.acquire()
+                self._slotless.discard(current)
+            finally:
+                self._queued -= 1
+
+    def sleep(self, seconds):
+        """Sleep for ``seconds`` without holding a pool slot"""
+        with self.idle():
+            gevent.sleep(seconds)
+
+
+class AdaptivePool(Pool):
+    """Pool that tunes its own size from observed host connection latency,
+    connection errors and event loop lag.
+
+    Size is increased additively by one slot for every ``size`` successful
+    connections and decreased multiplicatively by ``decrease_factor`` when
+    either more than ``max_error_rate`` of the last ``error_window``
+    connection attempts failed, recent connection latency is more than
+    ``latency_factor`` times the baseline latency or the event loop is
+    lagging by more than ``max_loop_lag`` seconds. Size is decreased at most
+    once every ``cooldown`` seconds so that a burst of failures from a single
+    overload only shrinks the pool once.
+
+    Baseline latency follows drops in latency straight away and rises
+    towards recent latency by ``baseline_decay`` of the difference on each
+    connection, so that hosts with consistently higher latency than others
+    do not keep shrinking the pool. Occasional failures, like those of hosts
+    that are down, do not shrink the pool as long as their rate stays below
+    ``max_error_rate``."""
+
+    def __init__(self, size=10, min_size=1, max_size=100,
+                 decrease_factor=0.5, latency_factor=2, max_loop_lag=0.5,
+                 cooldown=1, loop_lag_interval=0.1, max_error_rate=0.25,
+                 error_window=20, baseline_decay=0.05, greenlet_class=None):
+        """
+        :param size: (Optional) Starting pool size. Defaults to 10.
+        :type size: int
+        :param min_size: (Optional) Minimum pool size. Defaults to 1.
+        :type min_size: int
+        :param max_size: (Optional) Maximum pool size. Defaults to 100.
+        :type max_size: int
+        :param decrease_factor: (Optional) Factor to multiply size by on
+          decrease. Defaults to 0.5.
+        :type decrease_factor: float
+        :param latency_factor: (Optional) Increase in connection latency over
+          baseline, as multiple of it, at which to decrease size.
+          Defaults to 2.
+        :type latency_factor: float
+        :param max_loop_lag: (Optional) Event loop lag in seconds at which to
+          decrease size. Defaults to 0.5.
+        :type max_loop_lag: float
+        :param cooldown: (Optional) Minimum seconds between size decreases.
+          Defaults to 1.
+        :type cooldown: float
+        :param loop_lag_interval: (Optional) Seconds between event loop lag
+          measurements. Defaults to 0.1.
+        :type loop_lag_interval: float
+        :param max_error_rate: (Optional) Fraction of recent connection
+          attempts failing above which to decrease size. Defaults to 0.25.
+        :type max_error_rate: float
+        :param error_window: (Optional) Number of most recent connection
+          attempts to calculate error rate over. Error rate is only
+          calculated once at least a quarter of this many attempts have been
+          made. Defaults to 20.
+        :type error_window: int
+        :param baseline_decay: (Optional) Fraction of difference between
+          recent and baseline latency to move baseline up by on each
+          connection. Defaults to 0.05.
+        :type baseline_decay: float
+        """
+        if not 0 < min_size <= size <= max_size:
+            raise ValueError(
+                "Pool sizes must be 0 < min_size <= size <= max_size - got "
+                "%s, %s, %s" % (min_size, size, max_size,))
+        Pool.__init__(self, size=size, greenlet_class=greenlet_class)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.decrease_factor = decrease_factor
+        self.latency_factor = latency_factor
+        self.max_loop_lag = max_loop_lag
+        self.cooldown = cooldown
+        self.loop_lag_interval = loop_lag_interval
+        self.max_error_rate = max_error_rate
+        self.error_window = error_window
+        self.baseline_decay = baseline_decay
+        self.latency = None
+        self.baseline_latency = None
+        # Outcomes of most recent connection attempts - True on error
+        self._outcomes = deque(maxlen=error_window)
+        self.loop_lag = 0
+        self._increase_credit = 0
+        self._last_decrease = 0
+        self._monitor = None
+
+    def add(self, greenlet, *args, **kwargs):
+        if self._monitor is None or self._monitor.ready():
+            self._monitor = gevent.spawn(self._monitor_loop_lag)
+        return Pool.add(self, greenlet, *args, **kwargs)
+
+    def record_connect(self, latency):
+        """Record a successful host connection.
+
+        :param latency: Seconds taken to connect and authenticate
+        :type latency: float"""
+        self._outcomes.append(False)
+        self.latency = latency if self.latency is None \
+            else 0.7 * self.latency + 0.3 * latency
+        if self.baseline_latency is None \
+           or self.latency < self.baseline_latency:
+            self.baseline_latency = self.latency
+        else:
+            self.baseline_latency += self.baseline_decay * (
+                self.latency - self.baseline_latency)
+        if self.latency > self.latency_factor * self.baseline_latency:
+            self._decrease("connection latency %.3fs" % (self.latency,))
+            return
+        self._increase_credit += 1.0 / self.size
+        if self._increase_credit >= 1:
+            self._increase_credit = 0
+            if self.size < self.max_size:
+                self.resize(self.size + 1)
+
+    def record_error(self, ex):
+        """Record a failed host connection.
+
+        :param ex: Exception raised by connection attempt
+        :type ex: Exception"""
+        self._outcomes.append(True)
+        error_rate = self.error_rate
+        if error_rate is not None and error_rate > self.max_error_rate \
+           and self._decrease("connection error rate %.2f - %s" % (
+               error_rate, ex,)):
+            # Errors that caused decrease are not counted again
+            self._outcomes.clear()
+
+    @property
+    def error_rate(self):
+        """Fraction of most recent connection attempts that failed, or
+        ``None`` if too few attempts have been made"""
+        if len(self._outcomes) < max(self.error_window // 4, 1):
+            return
+        return float(sum(self._outcomes)) / len(self._outcomes)
+
+    def _decrease(self, reason):
+        now = time()
+        if now - self._last_decrease < self.cooldown:
+            return False
+        self._last_decrease = now
+        self._increase_credit = 0
+        size = max(self.min_size, int(self.size * self.decrease_factor))
+        if size < self.size:
+            logger.debug("Decreasing pool size %s -> %s on %s",
+                         self.size, size, reason)
+            self.resize(size)
+        return True
+
+    def _monitor_loop_lag(self):
+        while len(self):
+            start = time()
+            gevent.sleep(self.loop_lag_interval)
+            self.loop_lag = max(time() - start - self.loop_lag_interval, 0)
+            if self.loop_lag > self.max_loop_lag:
+                self._decrease("event loop lag %.3fs" % (self.loop_lag,))
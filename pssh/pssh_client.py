@@ -23,18 +23,31 @@ if 'threading' in sys.modules:
     del sys.modules['threading']
 from gevent import monkey  # noqa: E402
 monkey.patch_all()
+import os  # noqa: E402
 import string  # noqa: E402
 import random  # noqa: E402
 import logging  # noqa: E402
-
-import gevent.pool  # noqa: E402
+import weakref  # noqa: E402
+from collections import deque  # noqa: E402
+from contextlib import contextmanager  # noqa: E402
+from functools import partial  # noqa: E402
+from time import time  # noqa: E402
+
+import gevent  # noqa: E402
+import gevent.queue  # noqa: E402
 import gevent.hub  # noqa: E402
 gevent.hub.Hub.NOT_ERROR = (Exception,)
 
-from .exceptions import HostArgumentException  # noqa: E402
+from .exceptions import HostArgumentException, Timeout, \
+     ConnectionErrorException, SSHException, \
+     UnknownHostException, AuthenticationException  # noqa: E402
 from .constants import DEFAULT_RETRIES  # noqa: E402
 from .ssh_client import SSHClient  # noqa: E402
-from .output import HostOutput  # noqa: E402
+from .output import HostOutput, SpoolFile, StreamBuffer, RunResult, \
+     ConnectResult, timing_summary, group_output, \
+     _format_exception  # noqa: E402
+from .pool import Pool, AdaptivePool  # noqa: E402
+from .utils import read_openssh_hostname  # noqa: E402
 
 
 logger = logging.getLogger('pssh')
@@ -59,7 +72,11 @@ class ParallelSSHClient(object):
                  timeout=120, pool_size=10, proxy_host=None, proxy_port=22,
                  proxy_user=None, proxy_password=None, proxy_pkey=None,
                  agent=None, allow_agent=True, host_config=None,
-                 channel_timeout=None):
+                 channel_timeout=None, proxy_pool_size=1, retry_policy=None,
+                 max_pool_size=None, hooks=None, pump_output=False,
+                 max_connections=None, idle_timeout=None,
+                 keepalive_seconds=None, circuit_breaker=None,
+                 resolver=None):
         """
         :param hosts: Hosts to connect to
         :type hosts: list(str)
@@ -79,10 +96,8 @@ class ParallelSSHClient(object):
         :type num_retries: int
         :param timeout: (Optional) Number of seconds to wait before connection
           and authentication attempt times out. Note that total time before
-          timeout will be
-          ``timeout`` * ``num_retries`` + (5 * (``num_retries``-1)) number of
-          seconds, where (5 * (``num_retries``-1)) refers to a five (5) second
-          delay between retries.
+          timeout will be ``timeout`` * ``num_retries`` plus the delay between
+          retries as set by ``retry_policy``.
         :type timeout: int
         :param forward_ssh_agent: (Optional) Turn on/off SSH agent forwarding -
           equivalent to `ssh -A` from the `ssh` command line utility.
@@ -91,8 +106,17 @@ class ParallelSSHClient(object):
         :param pool_size: (Optional) Greenlet pool size. Controls on how many
           hosts to execute tasks in parallel. Defaults to 10. Overhead in event
           loop will determine how high this can be set to, see scaling guide
-          lines in project's readme.
+          lines in project's readme. Hosts waiting between connection retries
+          do not count towards pool size - see :py:class:`pssh.pool.Pool`
         :type pool_size: int
+        :param max_pool_size: (Optional) Enables adaptive pool size when set.
+          Pool size starts at ``pool_size`` and is then increased up to
+          ``max_pool_size`` while host connections are succeeding and
+          decreased on high connection error rate, increasing connection
+          latency or event loop lag - see :py:class:`pssh.pool.AdaptivePool`.
+          Current size is available as ``client.pool.size``. Defaults to
+          ``None`` for fixed pool size.
+        :type max_pool_size: int
         :param proxy_host: (Optional) SSH host to tunnel connection through
           so that SSH clients connect to host via client -> proxy_host -> host
         :type proxy_host: str
@@ -123,6 +147,63 @@ class ParallelSSHClient(object):
         :param allow_agent: (Optional) set to False to disable connecting to
           the system's SSH agent
         :type allow_agent: bool
+        :param proxy_pool_size: (Optional) Maximum number of connections to
+          ``proxy_host`` to share between all hosts. Connections to hosts are
+          tunneled over channels on these connections rather than each host
+          making its own connection to ``proxy_host``. Defaults to one.
+        :type proxy_pool_size: int
+        :param retry_policy: (Optional) Policy for delay between connection
+          attempts. Defaults to exponential back off with jitter starting at
+          one second - see :py:class:`pssh.retry.RetryPolicy`
+        :type retry_policy: :py:class:`pssh.retry.RetryPolicy`
+        :param hooks: (Optional) Hooks to call on connection, command and file
+          transfer events of all hosts - see
+          :py:class:`pssh.hooks.EventHooks` and
+          :py:class:`pssh.hooks.MetricsHooks`
+        :type hooks: :py:class:`pssh.hooks.EventHooks`
+        :param pump_output: (Optional) Read output of all commands in the
+          background as it arrives, with one greenlet per host and stream,
+          so that remote commands never block on unread output regardless
+          of when or in what order host output is iterated on. ``stdout`` and
+          ``stderr`` of host output are then
+          :py:class:`pssh.output.StreamBuffer` objects that yield output as
+          it is read and keep all of it in memory - use ``retention`` or
+          ``spool_dir`` on ``run_command`` to limit memory use instead.
+          Defaults to ``False``
+        :type pump_output: bool
+        :param max_connections: (Optional) Maximum number of host
+          connections to keep open. When exceeded, least recently used
+          connections are closed. Connections with commands or file copies
+          in progress are never closed, so the limit may be exceeded while
+          more than ``max_connections`` hosts are busy. Connections to
+          ``proxy_host`` are not counted - their number is set by
+          ``proxy_pool_size`` instead. Defaults to ``None`` for no limit
+        :type max_connections: int
+        :param idle_timeout: (Optional) Close host connections not used for
+          this many seconds, checked in the background. Defaults to ``None``
+          for connections to stay open
+        :type idle_timeout: int
+        :param keepalive_seconds: (Optional) Send SSH keepalive messages on
+          host connections every this many seconds when otherwise unused, to
+          keep idle connections open through firewalls and NAT and detect
+          dead ones. Dead connections are made again on next use either way.
+          Defaults to ``None`` for no keepalives
+        :type keepalive_seconds: int
+        :param circuit_breaker: (Optional) Skip connecting to hosts with
+          repeated recent connection failures, without retries, until their
+          cooldown has passed. Skipped hosts fail immediately with
+          :py:class:`pssh.exceptions.ConnectionErrorException`. Connection
+          failures are tracked across all commands run by this client.
+          Defaults to ``None`` for every command to always try to connect
+          - see :py:class:`pssh.circuit.CircuitBreaker`
+        :type circuit_breaker: :py:class:`pssh.circuit.CircuitBreaker`
+        :param resolver: (Optional) Caching resolver to resolve host names
+          with. When set, host names not yet connected to are resolved
+          concurrently before connecting and resolution errors are raised
+          immediately, without retries. Defaults to ``None`` for each host
+          to resolve its host name on every connection attempt - see
+          :py:class:`pssh.resolver.Resolver`
+        :type resolver: :py:class:`pssh.resolver.Resolver`
 
         **Example Usage**
 
@@ -348,7 +429,9 @@ class ParallelSSHClient(object):
           Connection is terminated.
         """
         self.pool_size = pool_size
-        self.pool = gevent.pool.Pool(size=self.pool_size)
+        self.pool = AdaptivePool(
+            size=self.pool_size, max_size=max_pool_size) \
+            if max_pool_size else Pool(size=self.pool_size)
         self.hosts = hosts
         self.user = user
         self.password = password
@@ -356,20 +439,109 @@ class ParallelSSHClient(object):
         self.port = port
         self.pkey = pkey
         self.num_retries = num_retries
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.resolver = resolver
+        self.hooks = hooks
         self.timeout = timeout
         self.proxy_host, self.proxy_port, self.proxy_user, \
             self.proxy_password, self.proxy_pkey = proxy_host, proxy_port, \
             proxy_user, proxy_password, proxy_pkey
-        # To hold host clients
+        self.proxy_pool_size = proxy_pool_size
+        self._proxy_clients = []
+        self._proxy_connect = None
+        self._proxy_index = 0
         self.host_clients = {}
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.keepalive_seconds = keepalive_seconds
+        self.num_evictions = 0
+        self.num_reconnects = 0
+        self.num_dead_connections = 0
+        self._last_used = {}
+        # Connected hosts and their time of use, in order of use. Entries of
+        # hosts used again since are stale and skipped
+        self._lru = deque()
+        self._in_use = {}
+        self._evicted = set()
+        # Greenlets consuming output in join, by host
+        self._consumers = {}
+        self._idle_reaper = gevent.spawn(
+            _reap_idle_clients, weakref.ref(self), idle_timeout / 2.0) \
+            if idle_timeout else None
         self.agent = agent
         self.allow_agent = allow_agent
         self.host_config = host_config if host_config else {}
         self.channel_timeout = channel_timeout
+        self.pump_output = pump_output
+
+    def connect(self, timeout=None, **paramiko_kwargs):
+        """Connect and authenticate to all hosts in parallel, honoring
+        self.pool_size, without running any commands.
+
+        Hosts already connected are not connected to again. Commands run
+        afterwards re-use connections made, so only need to open a channel
+        and the timing record of their first command on each host does not
+        include connection phases.
+
+        Connection errors do not stop other hosts being connected to and
+        are returned in results instead.
+
+        :param timeout: (Optional) Overall time in seconds to wait for all
+          hosts to be connected. Defaults to ``None`` which waits without a
+          deadline.
+        :type timeout: int
+        :param paramiko_kwargs: (Optional) Extra keyword arguments to be
+          passed on to :py:func:`paramiko.client.SSHClient.connect`
+        :type paramiko_kwargs: dict
+        :rtype: dict of host to :py:class:`pssh.output.ConnectResult`
+
+        :raises: :py:class:`pssh.exceptions.Timeout` on ``timeout`` reached
+          before all hosts have been connected to
+
+        **Example Usage**
+
+        .. code-block:: python
+
+          results = client.connect()
+          for host, result in results.items():
+              if not result.connected:
+                  print("Could not connect to %s - %s" % (
+                      host, result.exception))
+          output = client.run_command('uname')
+        """
+        hosts = self._resolve_hosts()
+        results = {}
+        cmds = [self.pool.spawn(self._connect_host, host, results,
+                                **paramiko_kwargs)
+                for host in hosts]
+        finished = gevent.joinall(cmds, timeout=timeout, raise_error=True)
+        if len(finished) < len(cmds):
+            gevent.killall(cmds)
+            raise Timeout("Timeout of %s seconds reached waiting for %s/%s "
+                          "hosts to connect", timeout,
+                          len(cmds) - len(finished), len(cmds))
+        return results
+
+    def _connect_host(self, host, results, **paramiko_kwargs):
+        """Connect to host and add its connect result to results"""
+        connected = self.host_clients.get(host) is not None
+        try:
+            with self._host_in_use(host):
+                self._make_ssh_client(host, **paramiko_kwargs)
+        except Exception as ex:
+            results[host] = ConnectResult(host, exception=ex)
+            return
+        timing = None
+        if not connected:
+            timing = self.host_clients[host]._reset_timing()
+        results[host] = ConnectResult(host, timing=timing)
 
     def run_command(self, command, sudo=False, user=None, stop_on_errors=True,
                     shell=None, use_shell=True, use_pty=True, host_args=None,
-                    encoding='utf-8', **paramiko_kwargs):
+                    encoding='utf-8', raw_output=False, retention=None,
+                    spool_dir=None, on_stdout=None, on_stderr=None,
+                    **paramiko_kwargs):
         """Run command on all hosts in parallel, honoring self.pool_size,
         and return output buffers.
 
@@ -420,6 +592,41 @@ class ParallelSSHClient(object):
         :param encoding: Encoding to use for output. Must be valid
             `Python codec <https://docs.python.org/2.7/library/codecs.html>`_
         :type encoding: str
+        :param raw_output: (Optional) Make ``stdout`` and ``stderr`` of host
+          output generators of raw ``bytes`` chunks as read from the SSH
+          channel. Output is not decoded, split into lines, stripped or
+          logged to ``host_logger``. Use :py:func:`pssh.utils.iter_lines` to
+          split into lines. Defaults to ``False``
+        :type raw_output: bool
+        :param retention: (Optional) Read all output in the background as it
+          arrives and keep only as much of each host's ``stdout`` and
+          ``stderr`` in memory as set by retention policy - for example last
+          200 lines with ``Retention(lines=200)``. Remote commands never
+          block on unread output. ``stdout`` and ``stderr`` of host output are
+          then :py:class:`pssh.output.OutputBuffer` objects that yield
+          retained output once command output has been fully read.
+          Defaults to ``None`` for no background reading - output is read
+          when iterated on.
+        :type retention: :py:class:`pssh.output.Retention`
+        :param spool_dir: (Optional) Directory to spool each host's output
+          to as it arrives, in files named ``<host>.stdout`` and
+          ``<host>.stderr``. Existing files are overwritten. ``stdout`` and
+          ``stderr`` of host output are then
+          :py:class:`pssh.output.SpoolFile` objects giving memory mapped
+          and line by line access to spooled output. Output is not logged to
+          ``host_logger``. Cannot be used together with ``retention``.
+          Defaults to ``None`` for no spooling.
+        :type spool_dir: str
+        :param on_stdout: (Optional) Function to call with host and each line
+          of ``stdout`` as it is read - ``bytes`` chunks instead of lines with
+          ``raw_output`` or ``spool_dir``. Output is passed to the function
+          instead of being logged to ``host_logger``. Called from the
+          greenlet reading output - output is read when iterated on unless
+          read in the background by ``retention``, ``spool_dir`` or
+          ``pump_output``. Must not block.
+        :type on_stdout: function
+        :param on_stderr: (Optional) As ``on_stdout`` for ``stderr``
+        :type on_stderr: function
         :param paramiko_kwargs: (Optional) Extra keyword arguments to be
           passed on to :py:func:`paramiko.client.SSHClient.connect`
         :type paramiko_kwargs: dict
@@ -442,6 +649,8 @@ class ParallelSSHClient(object):
           string format
         :raises: :py:class:`KeyError` on no host argument key in arguments
           dict for cmd string format
+        :raises: :py:class:`ValueError` on both ``retention`` and
+          ``spool_dir`` being set
 
         **Example Usage**
 
@@ -664,7 +873,10 @@ class ParallelSSHClient(object):
           writing to stdin
 
         """
+        if retention is not None and spool_dir is not None:
+            raise ValueError("Only one of retention and spool_dir may be set")
         output = {}
+        hosts = self._resolve_hosts()
         if host_args:
             try:
                 cmds = [self.pool.spawn(self._exec_command, host,
@@ -672,7 +884,7 @@ class ParallelSSHClient(object):
                                         sudo=sudo, user=user, shell=shell,
                                         use_shell=use_shell, use_pty=use_pty,
                                         **paramiko_kwargs)
-                        for host_i, host in enumerate(self.hosts)]
+                        for host_i, host in enumerate(hosts)]
             except IndexError:
                 raise HostArgumentException(
                     "Number of host arguments provided does not match "
@@ -683,15 +895,36 @@ class ParallelSSHClient(object):
                 sudo=sudo, user=user, shell=shell,
                 use_shell=use_shell, use_pty=use_pty,
                 **paramiko_kwargs)
-                for host in self.hosts]
+                for host in hosts]
         for cmd in cmds:
             try:
-                self.get_output(cmd, output, encoding=encoding)
+                self.get_output(cmd, output, encoding=encoding,
+                                raw_output=raw_output, retention=retention,
+                                spool_dir=spool_dir, on_stdout=on_stdout,
+                                on_stderr=on_stderr)
             except Exception:
                 if stop_on_errors:
                     raise
         return output
 
+    def _resolve_hosts(self):
+        """Resolve names of hosts not connected to, if resolver is set, and
+        return hosts to run on. Host names are resolved by proxy host instead
+        when one is set.
+
+        Names are resolved after applying OpenSSH config, as host clients
+        connect to the ``HostName`` configured for a host, if any.
+
+        Hosts are read into a list when resolved so that host iterators, like
+        generators, are not exhausted before being run on"""
+        if self.resolver is None or self.proxy_host:
+            return self.hosts
+        hosts = list(self.hosts)
+        self.resolver.resolve_all(
+            [read_openssh_hostname(host) for host in hosts
+             if self.host_clients.get(host) is None])
+        return hosts
+
     def _get_host_config_values(self, host):
         _user = self.host_config.get(host, {}).get('user', self.user)
         _port = self.host_config.get(host, {}).get('port', self.port)
@@ -703,24 +936,36 @@ class ParallelSSHClient(object):
     def _exec_command(self, host, command, sudo=False, user=None,
                       shell=None, use_shell=True, use_pty=True,
                       **paramiko_kwargs):
-        """Make SSHClient, run command on host"""
-        if host not in self.host_clients or self.host_clients[host] is None:
-            _user, _port, _password, _pkey = self._get_host_config_values(host)
-            _user = user if user else _user
-            self.host_clients[host] = SSHClient(
-                host, user=_user, password=_password, port=_port, pkey=_pkey,
-                forward_ssh_agent=self.forward_ssh_agent,
-                num_retries=self.num_retries, timeout=self.timeout,
-                proxy_host=self.proxy_host, proxy_port=self.proxy_port,
-                proxy_user=self.proxy_user, proxy_password=self.proxy_password,
-                proxy_pkey=self.proxy_pkey, allow_agent=self.allow_agent,
-                agent=self.agent, channel_timeout=self.channel_timeout,
-                **paramiko_kwargs)
-        return self.host_clients[host].exec_command(
-            command, sudo=sudo, user=user, shell=shell,
-            use_shell=use_shell, use_pty=use_pty)
+        """Make SSHClient, run command on host.
 
-    def get_output(self, cmd, output, encoding='utf-8'):
+        Host returned is ``host`` as given rather than that of its client,
+        which may differ when set by ``HostName`` in OpenSSH config.
+
+        Client command was run on is returned along with its output as it
+        may be evicted from ``self.host_clients`` by other hosts connecting
+        before output is collected"""
+        with self._host_in_use(host):
+            self._make_ssh_client(host, user=user, **paramiko_kwargs)
+            client = self.host_clients[host]
+            try:
+                channel, _, stdout, stderr, stdin = client.exec_command(
+                    command, sudo=sudo, user=user, shell=shell,
+                    use_shell=use_shell, use_pty=use_pty)
+                return channel, host, stdout, stderr, stdin, client
+            except Exception:
+                if client.is_alive:
+                    raise
+            # Connection found dead on use - connect again and retry once
+            self._make_ssh_client(host, user=user, **paramiko_kwargs)
+            client = self.host_clients[host]
+            channel, _, stdout, stderr, stdin = client.exec_command(
+                command, sudo=sudo, user=user, shell=shell,
+                use_shell=use_shell, use_pty=use_pty)
+            return channel, host, stdout, stderr, stdin, client
+
+    def get_output(self, cmd, output, encoding='utf-8', raw_output=False,
+                   retention=None, spool_dir=None, on_stdout=None,
+                   on_stderr=None):
         """Get output from command.
 
         :param cmd: Command to get output from
@@ -729,6 +974,25 @@ class ParallelSSHClient(object):
           :py:class:`pssh.output.HostOutput` values to be updated with output
           from cmd
         :type output: dict
+        :param encoding: Encoding to use for output
+        :type encoding: str
+        :param raw_output: (Optional) Make output buffers generators of raw
+          ``bytes`` chunks - see
+          :py:func:`pssh.pssh_client.ParallelSSHClient.run_command`
+        :type raw_output: bool
+        :param retention: (Optional) Read output in the background keeping
+          only as much as set by retention policy - see
+          :py:func:`pssh.pssh_client.ParallelSSHClient.run_command`
+        :type retention: :py:class:`pssh.output.Retention`
+        :param spool_dir: (Optional) Directory to spool output to - see
+          :py:func:`pssh.pssh_client.ParallelSSHClient.run_command`
+        :type spool_dir: str
+        :param on_stdout: (Optional) Function to call with host and output
+          of ``stdout`` as it is read - see
+          :py:func:`pssh.pssh_client.ParallelSSHClient.run_command`
+        :type on_stdout: function
+        :param on_stderr: (Optional) As ``on_stdout`` for ``stderr``
+        :type on_stderr: function
         :rtype: None
 
         `output` parameter is modified in-place and has the following structure
@@ -763,7 +1027,7 @@ class ParallelSSHClient(object):
 
         """
         try:
-            (channel, host, stdout, stderr, stdin) = cmd.get()
+            (channel, host, stdout, stderr, stdin, host_client) = cmd.get()
         except Exception as ex:
             exc = sys.exc_info()
             try:
@@ -775,20 +1039,70 @@ class ParallelSSHClient(object):
             self._update_host_output(
                 output, host, None, None, None, None, None, cmd, exception=ex)
             raise
-        stdout = self.host_clients[host].read_output_buffer(
-            stdout, callback=self.get_exit_codes,
-            callback_args=(output,),
-            encoding=encoding)
-        stderr = self.host_clients[host].read_output_buffer(
-            stderr, prefix='\t[err]', callback=self.get_exit_codes,
-            callback_args=(output,),
-            encoding=encoding)
-        self._update_host_output(output, host, self._get_exit_code(channel),
-                                 channel, stdout, stderr, stdin, cmd)
+        timing = host_client.timing
+        host_output = self._update_host_output(
+            output, host, None, channel, None, None,
+            stdin, cmd, timing=timing)
+        self._set_exit_code(host_output)
+        drained = set()
+        if raw_output or spool_dir is not None:
+            host_output.stdout = host_client.read_output_chunks(
+                channel, callback=self._output_drained,
+                callback_args=(host_output, 'stdout', drained),
+                on_output=on_stdout, timing=timing)
+            host_output.stderr = host_client.read_output_chunks(
+                channel, stream='stderr', callback=self._output_drained,
+                callback_args=(host_output, 'stderr', drained),
+                on_output=on_stderr, timing=timing)
+        else:
+            host_output.stdout = host_client.read_output_buffer(
+                stdout, callback=self._output_drained,
+                callback_args=(host_output, 'stdout', drained),
+                encoding=encoding, on_output=on_stdout, timing=timing)
+            host_output.stderr = host_client.read_output_buffer(
+                stderr, prefix='\t[err]', callback=self._output_drained,
+                callback_args=(host_output, 'stderr', drained),
+                encoding=encoding, stream='stderr', on_output=on_stderr,
+                timing=timing)
+        if spool_dir is not None:
+            host_output.stdout = self._pump(host_output.stdout, SpoolFile(
+                self._spool_path(spool_dir, host_output.host, 'stdout'),
+                encoding=encoding))
+            host_output.stderr = self._pump(host_output.stderr, SpoolFile(
+                self._spool_path(spool_dir, host_output.host, 'stderr'),
+                encoding=encoding))
+        elif retention is not None:
+            host_output.stdout = self._pump(
+                host_output.stdout, retention.make_buffer(encoding))
+            host_output.stderr = self._pump(
+                host_output.stderr, retention.make_buffer(encoding))
+        elif self.pump_output:
+            host_output.stdout = self._pump(host_output.stdout, StreamBuffer())
+            host_output.stderr = self._pump(host_output.stderr, StreamBuffer())
+        gevent.spawn(self._wait_exit_code, host_output)
+
+    def _output_drained(self, host_output, stream, drained):
+        """Record exit code once a stream has been read to the end, closing
+        channel when both stdout and stderr have been drained"""
+        drained.add(stream)
+        self._set_exit_code(host_output)
+        if len(drained) == 2 and host_output.exit_code is not None:
+            host_output.channel.close()
+
+    def _spool_path(self, spool_dir, host, stream):
+        return os.path.join(spool_dir, '%s.%s' % (
+            host.replace(os.path.sep, '_'), stream,))
+
+    def _pump(self, output_buffer, buffer):
+        """Read output generator into buffer in background greenlet and
+        return buffer"""
+        gevent.spawn(buffer.fill, output_buffer)
+        return buffer
 
     def _update_host_output(self, output, host, exit_code, channel, stdout,
-                            stderr, stdin, cmd, exception=None):
-        """Update host output with given data"""
+                            stderr, stdin, cmd, exception=None, timing=None):
+        """Update host output with given data and return host output
+        object"""
         if host in output:
             new_host = "_".join([host,
                                  ''.join(random.choice(
@@ -799,12 +1113,16 @@ class ParallelSSHClient(object):
             host = new_host
         output[host] = HostOutput(host, cmd, channel, stdout, stderr, stdin,
                                   exit_code=exit_code,
-                                  exception=exception)
+                                  exception=exception, timing=timing)
+        return output[host]
 
-    def join(self, output, consume_output=False):
+    def join(self, output, consume_output=False, timeout=None):
         """Block until all remote commands in output have finished
         and retrieve exit codes
 
+        All hosts are waited on concurrently - total time spent in ``join``
+        is that of the slowest host rather than the sum of all hosts.
+
         :param output: Output of commands to join on
         :type output: dict as returned by
           :py:func:`pssh.pssh_client.ParallelSSHClient.get_output`
@@ -813,6 +1131,16 @@ class ParallelSSHClient(object):
           to ``True``. Must be set to ``True`` to allow host logger to log
           output on call to ``join``.
         :type consume_output: bool
+        :param timeout: (Optional) Overall time in seconds to wait for all
+          commands to finish. Defaults to ``None`` which waits without a
+          deadline.
+        :type timeout: int
+
+        :raises: :py:class:`pssh.exceptions.Timeout` on ``timeout`` reached
+          before all commands have finished. Exit codes of commands that
+          have finished are still updated in ``output`` and output of
+          commands not finished can still be read. With ``consume_output``,
+          output continues to be consumed in the background.
 
         :Enabling host logger:
 
@@ -846,28 +1174,161 @@ class ParallelSSHClient(object):
         .. code-block:: python
 
           [my_host1] <..>
+
+        :Joining with a deadline:
+
+        .. code-block:: python
+
+          from pssh.exceptions import Timeout
+
+          output = client.run_command('sleep 10')
+          try:
+              client.join(output, timeout=5)
+          except Timeout:
+              pass
         """
-        for host in output:
-            output[host].cmd.join()
-            if output[host].channel is not None:
-                output[host].channel.recv_exit_status()
-            if consume_output:
-                for line in output[host].stdout:
-                    pass
-                for line in output[host].stderr:
-                    pass
+        cmds = [gevent.spawn(self._join, output[host],
+                             consume_output=consume_output)
+                for host in output]
+        finished = gevent.joinall(cmds, timeout=timeout, raise_error=True)
+        if len(finished) < len(cmds):
+            # Only waiting greenlets are killed - greenlets consuming output
+            # are left to finish so that output generators are not
+            # interrupted part way through
+            gevent.killall(cmds)
+            self.get_exit_codes(output)
+            raise Timeout("Timeout of %s seconds reached waiting for %s/%s "
+                          "commands to finish", timeout,
+                          len(cmds) - len(finished), len(cmds))
         self.get_exit_codes(output)
 
+    def _join(self, host_output, consume_output=False):
+        """Wait for command in host output to finish, reading its output
+        buffers first if ``consume_output`` is set"""
+        host_output.cmd.join()
+        if consume_output:
+            self._get_consumer(host_output).get()
+        if host_output.channel is not None:
+            host_output.channel.recv_exit_status()
+        self._touch_client(host_output.host)
+
+    def _get_consumer(self, host_output):
+        """Get greenlet consuming host output's buffers, re-using one still
+        running from a previous ``join`` that timed out"""
+        host = host_output.host
+        _host_output, consumer = self._consumers.get(host, (None, None))
+        if _host_output is host_output:
+            return consumer
+        consumer = gevent.spawn(self._consume_output, host_output)
+        self._consumers[host] = (host_output, consumer)
+        consumer.link(partial(self._discard_consumer, host))
+        return consumer
+
+    def _discard_consumer(self, host, consumer):
+        if self._consumers.get(host, (None, None))[1] is consumer:
+            del self._consumers[host]
+
+    def _consume_output(self, host_output):
+        stderr_reader = None
+        if host_output.stderr is not None:
+            stderr_reader = gevent.spawn(self._consume, host_output.stderr)
+        try:
+            self._consume(host_output.stdout)
+            if stderr_reader is not None:
+                stderr_reader.get()
+        finally:
+            if stderr_reader is not None:
+                stderr_reader.kill()
+
+    def _consume(self, output_buffer):
+        if output_buffer is None:
+            return
+        for line in output_buffer:
+            pass
+
+    def as_completed(self, output, timeout=None):
+        """Iterate over host output in the order commands finish.
+
+        Each :py:class:`pssh.output.HostOutput` is yielded as soon as its
+        command has exited, with exit code already set. Completion is
+        signalled by each channel's exit status event - channels are not
+        polled.
+
+        Host output with an exception, and so no channel, is yielded
+        immediately.
+
+        :param output: Output of commands as returned by
+          :py:func:`pssh.pssh_client.ParallelSSHClient.run_command`
+        :type output: dict
+        :param timeout: (Optional) Overall time in seconds to wait for all
+          commands to finish. Defaults to ``None`` which waits without a
+          deadline.
+        :type timeout: int
+        :rtype: Generator of :py:class:`pssh.output.HostOutput`
+
+        :raises: :py:class:`pssh.exceptions.Timeout` on ``timeout`` reached
+          before all commands have finished.
+
+        **Example Usage**
+
+        .. code-block:: python
+
+          output = client.run_command('uname')
+          for host_output in client.as_completed(output):
+              print(host_output.host, host_output.exit_code)
+              for line in host_output.stdout:
+                  print(line)
+
+        .. note ::
+
+          Output buffers are not read by ``as_completed``. Commands producing
+          more output than fits in the SSH channel's window will not finish
+          until their output is read.
+        """
+        finished = gevent.queue.Queue()
+        waiters = [gevent.spawn(self._wait_exit_code, output[host], finished)
+                   for host in output]
+        deadline = time() + timeout if timeout is not None else None
+        try:
+            for _ in xrange(len(waiters)):
+                _timeout = max(deadline - time(), 0) \
+                    if deadline is not None else None
+                try:
+                    yield finished.get(timeout=_timeout)
+                except gevent.queue.Empty:
+                    raise Timeout(
+                        "Timeout of %s seconds reached waiting for commands "
+                        "to finish", timeout)
+        finally:
+            gevent.killall(waiters)
+
+    def _wait_exit_code(self, host_output, finished=None):
+        """Wait on channel's exit status event and record exit code in host
+        output, putting host output on ``finished`` queue if provided"""
+        try:
+            host_output.cmd.join()
+            if host_output.channel is not None:
+                host_output.channel.status_event.wait()
+                self._set_exit_code(host_output)
+        finally:
+            if finished is not None:
+                finished.put(host_output)
+
     def finished(self, output):
         """Check if commands have finished without blocking
 
         :param output: As returned by
           :py:func:`pssh.pssh_client.ParallelSSHClient.get_output`
         :rtype: bool
+
+        Exit codes are recorded as soon as each command's exit status is
+        received, so checking a host is a constant time operation.
         """
         for host in output:
-            chan = output[host].channel
-            if chan is not None and not chan.closed:
+            host_output = output[host]
+            chan = host_output.channel
+            if chan is not None and host_output.exit_code is None \
+               and not chan.closed:
                 return False
         return True
 
@@ -894,11 +1355,106 @@ class ParallelSSHClient(object):
         channel = host_output.channel
         return self._get_exit_code(channel)
 
-    def _get_exit_code(self, channel):
-        """Get exit code from channel if ready"""
+    def _set_exit_code(self, host_output):
+        """Update exit code of single host output if available.
+
+        Called when command is started, exits or its output is read to the
+        end, all of which count as use of host's connection. Channel is left
+        open so that output not yet read is not lost"""
+        self._touch_client(host_output.host)
+        if host_output.exit_code is None:
+            host_output.exit_code = self._get_exit_code(
+                host_output.channel, close=False)
+            if host_output.exit_code is None:
+                return
+            if host_output.timing is not None:
+                host_output.timing.mark('exited')
+            if self.hooks is not None:
+                self.hooks.command_exit(
+                    host_output.host, host_output.exit_code,
+                    host_output.timing.durations()['command']
+                    if host_output.timing is not None else None)
+
+    def group_output(self, output):
+        """Group hosts by identical standard output and error.
+
+        See :py:func:`pssh.output.group_output`
+
+        :param output: As returned by
+          :py:func:`pssh.pssh_client.ParallelSSHClient.run_command`
+        :type output: dict
+        :rtype: list(:py:class:`pssh.output.OutputGroup`) in descending
+          order of number of hosts
+
+        **Example Usage**
+
+        .. code-block:: python
+
+          output = client.run_command('uname -r')
+          for group in client.group_output(output):
+              print(", ".join(group.hosts))
+              for line in group.stdout:
+                  print(line)
+        """
+        return group_output(output)
+
+    def timing_summary(self, output, percentiles=(50, 90, 99)):
+        """Summarise durations of connection and command phases over all
+        hosts in output.
+
+        :param output: As returned by
+          :py:func:`pssh.pssh_client.ParallelSSHClient.run_command`
+        :type output: dict
+        :param percentiles: (Optional) Percentiles to calculate
+        :type percentiles: tuple(int)
+        :rtype: dict of phase name to dict of ``count``, ``min``, ``max``,
+          ``mean`` and ``p<N>`` per percentile, in seconds - see
+          :py:class:`pssh.output.HostTiming` for phases
+
+        **Example Usage**
+
+        .. code-block:: python
+
+          output = client.run_command('uname')
+          client.join(output)
+          summary = client.timing_summary(output)
+          print(summary['connect']['p90'])
+        """
+        return timing_summary((output[host].timing for host in output),
+                              percentiles=percentiles)
+
+    def run_summary(self, output):
+        """Make columnar summary of exit codes, exceptions and phase
+        durations of all hosts in output.
+
+        See :py:class:`pssh.output.RunResult`
+
+        :param output: As returned by
+          :py:func:`pssh.pssh_client.ParallelSSHClient.run_command`
+        :type output: dict
+        :rtype: :py:class:`pssh.output.RunResult`
+
+        **Example Usage**
+
+        .. code-block:: python
+
+          output = client.run_command('uname')
+          client.join(output)
+          summary = client.run_summary(output)
+          print(summary.failed_hosts())
+          print(summary.exit_code_histogram())
+          print(summary.percentiles('command'))
+          print(summary.slowest(10))
+        """
+        return RunResult.from_output(output)
+
+    def _get_exit_code(self, channel, close=True):
+        """Get exit code from channel if ready, closing channel if
+        ``close`` is set"""
         if channel is None or not channel.exit_status_ready():
             return
-        channel.close()
+        if close:
+            channel.close()
         return channel.recv_exit_status()
 
     def copy_file(self, local_file, remote_file, recurse=False):
@@ -944,9 +1500,10 @@ class ParallelSSHClient(object):
 
     def _copy_file(self, host, local_file, remote_file, recurse=False):
         """Make sftp client, copy file"""
-        self._make_ssh_client(host)
-        return self.host_clients[host].copy_file(local_file, remote_file,
-                                                 recurse=recurse)
+        with self._host_in_use(host):
+            self._make_ssh_client(host)
+            return self.host_clients[host].copy_file(
+                local_file, remote_file, recurse=recurse)
 
     def copy_remote_file(self, remote_file, local_file, recurse=False,
                          suffix_separator='_'):
@@ -1009,19 +1566,239 @@ class ParallelSSHClient(object):
                           suffix_separator='_'):
         """Make sftp client, copy file to local"""
         file_w_suffix = suffix_separator.join([local_file, host])
-        self._make_ssh_client(host)
-        return self.host_clients[host].copy_remote_file(
+        with self._host_in_use(host):
+            self._make_ssh_client(host)
+            return self.host_clients[host].copy_remote_file(
                 remote_file, file_w_suffix, recurse=recurse)
 
-    def _make_ssh_client(self, host):
+    def _make_ssh_client(self, host, user=None, **paramiko_kwargs):
+        client = self.host_clients.get(host)
+        if client is not None and not client.is_alive:
+            self._drop_dead_client(host)
         if host not in self.host_clients or self.host_clients[host] is None:
             _user, _port, _password, _pkey = self._get_host_config_values(host)
-            self.host_clients[host] = SSHClient(
-                host, user=_user, password=_password, port=_port, pkey=_pkey,
-                forward_ssh_agent=self.forward_ssh_agent,
-                num_retries=self.num_retries,
-                timeout=self.timeout,
-                proxy_host=self.proxy_host,
-                proxy_port=self.proxy_port,
-                agent=self.agent,
-                channel_timeout=self.channel_timeout)
+            _user = user if user else _user
+            if self.circuit_breaker is not None \
+               and not self.circuit_breaker.allow(host):
+                raise ConnectionErrorException(
+                    "Skipped connecting to host '%s:%s' after %s consecutive "
+                    "connection failures - circuit open",
+                    host, _port, self.circuit_breaker.failures(host))
+            proxy_client = self._get_proxy_client(host, _port,
+                                                  **paramiko_kwargs) \
+                if self.proxy_host else None
+            try:
+                client = SSHClient(
+                    host, user=_user, password=_password, port=_port,
+                    pkey=_pkey, forward_ssh_agent=self.forward_ssh_agent,
+                    num_retries=self.num_retries, timeout=self.timeout,
+                    proxy_host=self.proxy_host, proxy_port=self.proxy_port,
+                    proxy_user=self.proxy_user,
+                    proxy_password=self.proxy_password,
+                    proxy_pkey=self.proxy_pkey, allow_agent=self.allow_agent,
+                    agent=self.agent, channel_timeout=self.channel_timeout,
+                    proxy_client=proxy_client,
+                    retry_policy=self.retry_policy, hooks=self.hooks,
+                    keepalive_seconds=self.keepalive_seconds,
+                    resolver=self.resolver,
+                    _sleep=self.pool.sleep, **paramiko_kwargs)
+            except UnknownHostException:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record_failure(host)
+                raise
+            except (ConnectionErrorException, SSHException) as ex:
+                if self.circuit_breaker is not None \
+                   and isinstance(ex, ConnectionErrorException):
+                    self.circuit_breaker.record_failure(host)
+                if isinstance(self.pool, AdaptivePool):
+                    self.pool.record_error(ex)
+                raise
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_success(host)
+            if isinstance(self.pool, AdaptivePool):
+                self.pool.record_connect(client.connect_latency)
+            if host in self._evicted:
+                self._evicted.discard(host)
+                self.num_reconnects += 1
+            self.host_clients[host] = client
+        self._touch(host)
+        if self.max_connections is not None \
+           and len(self.host_clients) > self.max_connections:
+            self._evict_lru()
+
+    def _touch(self, host):
+        """Record use of host's connection, making it most recently used"""
+        now = time()
+        self._last_used[host] = now
+        self._lru.append((host, now))
+        if len(self._lru) > 2 * len(self.host_clients) + 16:
+            self._lru = deque([(_host, self._last_used[_host])
+                               for _host in self._lru_hosts()])
+
+    def _lru_hosts(self):
+        """Iterate over connected hosts, least recently used first"""
+        seen = set()
+        for host, last_used in self._lru:
+            if host in seen or self._last_used.get(host) != last_used:
+                continue
+            seen.add(host)
+            yield host
+
+    def _touch_client(self, host):
+        """Record use of host's connection, if host is connected"""
+        if self.host_clients.get(host) is not None:
+            self._touch(host)
+
+    @contextmanager
+    def _host_in_use(self, host):
+        """Keep host's connection from being evicted while in use"""
+        self._in_use[host] = self._in_use.get(host, 0) + 1
+        try:
+            yield
+        finally:
+            self._in_use[host] -= 1
+            if not self._in_use[host]:
+                del self._in_use[host]
+
+    def _host_busy(self, host):
+        client = self.host_clients[host]
+        return host in self._in_use or (
+            client is not None and client.num_open_channels > 0)
+
+    def _evict(self, host):
+        client = self.host_clients.pop(host)
+        self._last_used.pop(host, None)
+        if client is not None:
+            logger.debug("Closing connection to host %s", host)
+            client.close()
+        self._evicted.add(host)
+        self.num_evictions += 1
+
+    def _drop_dead_client(self, host):
+        logger.warning("Connection to host %s is no longer active - "
+                       "reconnecting", host)
+        client = self.host_clients.pop(host)
+        self._last_used.pop(host, None)
+        client.close()
+        self._evicted.add(host)
+        self.num_dead_connections += 1
+
+    def _evict_lru(self):
+        """Close least recently used connections not in use until at most
+        ``max_connections`` are open"""
+        excess = len(self.host_clients) - self.max_connections
+        evict = []
+        for host in self._lru_hosts():
+            if len(evict) >= excess:
+                break
+            if not self._host_busy(host):
+                evict.append(host)
+        for host in evict:
+            self._evict(host)
+
+    def evict_idle(self, idle_timeout=None):
+        """Close host connections not used for ``idle_timeout`` seconds and
+        not in use.
+
+        Called periodically in the background when client has an
+        ``idle_timeout``.
+
+        :param idle_timeout: (Optional) Idle time in seconds. Defaults to
+          client's ``idle_timeout``
+        :type idle_timeout: int
+        :rtype: int - number of connections closed"""
+        idle_timeout = idle_timeout if idle_timeout is not None \
+            else self.idle_timeout
+        if idle_timeout is None:
+            return 0
+        last_use = time() - idle_timeout
+        evict = []
+        for host in self._lru_hosts():
+            # Least recently used first - rest were used more recently
+            if self._last_used[host] > last_use:
+                break
+            if not self._host_busy(host):
+                evict.append(host)
+        for host in evict:
+            self._evict(host)
+        return len(evict)
+
+    @property
+    def num_proxy_connections(self):
+        """Number of currently active connections to ``proxy_host`` shared by
+        all host clients"""
+        return len([_client for _client in self._proxy_clients
+                    if self._proxy_client_active(_client)])
+
+    def _proxy_client_active(self, proxy_client):
+        transport = proxy_client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def _get_proxy_client(self, host, port, **paramiko_kwargs):
+        """Get a connection to ``proxy_host`` to open tunnel channels on to
+        ``host``.
+
+        New connections are made until ``proxy_pool_size`` connections are
+        active, after which existing connections are handed out in round
+        robin order. Concurrent callers wait on a single connection attempt
+        and share its result, including any connection error.
+
+        Errors connecting to proxy host are raised for ``host`` rather than
+        proxy host so that output is keyed by the host that could not be
+        reached."""
+        try:
+            return self._get_shared_proxy_client(**paramiko_kwargs)
+        except (AuthenticationException, UnknownHostException,
+                ConnectionErrorException, SSHException) as ex:
+            raise ex.__class__(
+                "Error connecting to host '%s:%s' via proxy host - %s",
+                host, port, _format_exception(ex))
+
+    def _get_shared_proxy_client(self, **paramiko_kwargs):
+        self._proxy_clients = [_client for _client in self._proxy_clients
+                               if self._proxy_client_active(_client)]
+        if len(self._proxy_clients) < self.proxy_pool_size:
+            if self._proxy_connect is None:
+                self._proxy_connect = gevent.spawn(
+                    self._make_proxy_client, **paramiko_kwargs)
+            proxy_connect = self._proxy_connect
+            try:
+                with self.pool.idle():
+                    proxy_client = proxy_connect.get()
+            finally:
+                if self._proxy_connect is proxy_connect:
+                    self._proxy_connect = None
+            if proxy_client not in self._proxy_clients:
+                self._proxy_clients.append(proxy_client)
+            return proxy_client
+        self._proxy_index = (self._proxy_index + 1) % len(self._proxy_clients)
+        return self._proxy_clients[self._proxy_index]
+
+    def _make_proxy_client(self, **paramiko_kwargs):
+        logger.info("Making new connection to proxy host %s:%s - %s existing",
+                    self.proxy_host, self.proxy_port,
+                    len(self._proxy_clients))
+        return SSHClient(
+            self.proxy_host,
+            user=self.proxy_user if self.proxy_user else self.user,
+            password=self.proxy_password if self.proxy_password
+            else self.password,
+            port=self.proxy_port,
+            pkey=self.proxy_pkey if self.proxy_pkey else self.pkey,
+            forward_ssh_agent=False, num_retries=self.num_retries,
+            timeout=self.timeout, allow_agent=self.allow_agent,
+            agent=self.agent, retry_policy=self.retry_policy,
+            resolver=self.resolver,
+            _sleep=self.pool.sleep, **paramiko_kwargs).client
+
+
+def _reap_idle_clients(client_ref, interval):
+    """Close idle connections of client every ``interval`` seconds for as
+    long as client exists"""
+    while True:
+        gevent.sleep(interval)
+        client = client_ref()
+        if client is None:
+            return
+        client.evict_idle()
+        del client
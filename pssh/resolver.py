@@ -0,0 +1,159 @@
+# This file is part of parallel-ssh.
+
+# Copyright (C) 2014-2017 Panos Kittenis
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation, version 2.1.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Host name resolution cache module of ParallelSSH"""
+
+import socket
+from socket import gaierror as sock_gaierror
+
+try:
+    from time import monotonic
+except ImportError:
+    from time import time as monotonic
+
+import gevent.pool
+
+from .constants import DEFAULT_DNS_TTL, DEFAULT_DNS_NEGATIVE_TTL, \
+     DEFAULT_RESOLVER_POOL_SIZE
+
+
+class Resolver(object):
+    """Caching host name resolver.
+
+    Addresses of resolved host names are kept for ``ttl`` seconds and
+    resolution errors for ``negative_ttl`` seconds, so that clients
+    connecting to the same hosts again do not resolve them again. Many host
+    names can be resolved concurrently ahead of connecting with
+    :py:func:`resolve_all`.
+
+    Resolution uses gevent's configured resolver - see gevent documentation
+    on ``GEVENT_RESOLVER`` for resolvers that do not use a thread pool."""
+
+    def __init__(self, ttl=DEFAULT_DNS_TTL,
+                 negative_ttl=DEFAULT_DNS_NEGATIVE_TTL,
+                 pool_size=DEFAULT_RESOLVER_POOL_SIZE):
+        """
+        :param ttl: (Optional) Seconds to cache addresses of resolved host
+          names for. Defaults to 300.
+        :type ttl: float
+        :param negative_ttl: (Optional) Seconds to cache resolution errors
+          for. Defaults to 30.
+        :type negative_ttl: float
+        :param pool_size: (Optional) Maximum number of host names to resolve
+          concurrently in :py:func:`resolve_all`. Defaults to 100.
+        :type pool_size: int
+
+        **Example Usage**
+
+        .. code-block:: python
+
+          from pssh import ParallelSSHClient
+          from pssh.resolver import Resolver
+
+          client = ParallelSSHClient(hosts, resolver=Resolver(ttl=600))
+        """
+        if ttl < 0 or negative_ttl < 0:
+            raise ValueError("Cache times must not be negative - got %s, %s"
+                             % (ttl, negative_ttl,))
+        if pool_size < 1:
+            raise ValueError("Pool size must be at least one - got %s"
+                             % (pool_size,))
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.pool_size = pool_size
+        self.num_lookups = 0
+        self._cache = {}
+        self._next_prune = 0
+
+    def resolve(self, host, port):
+        """Resolve host name to addresses to connect to, from cache if
+        available.
+
+        :param host: Host name to resolve
+        :type host: str
+        :param port: Port to connect to
+        :type port: int
+        :rtype: list of address tuples as returned by
+          :py:func:`socket.getaddrinfo`
+        :raises: :py:class:`socket.gaierror` on resolution error"""
+        return [(family, socktype, proto, canonname,
+                 address[:1] + (port,) + address[2:])
+                for family, socktype, proto, canonname, address
+                in self._lookup(host)]
+
+    def _lookup(self, host):
+        """Get addresses of host, without port, from cache or resolver"""
+        now = monotonic()
+        cached = self._cache.get(host)
+        if cached is not None and cached[0] > now:
+            if isinstance(cached[1], Exception):
+                raise cached[1]
+            return cached[1]
+        self._prune(now)
+        self.num_lookups += 1
+        try:
+            addresses = socket.getaddrinfo(host, 0, socket.AF_UNSPEC,
+                                           socket.SOCK_STREAM)
+        except sock_gaierror as ex:
+            self._cache[host] = (monotonic() + self.negative_ttl, ex)
+            raise
+        self._cache[host] = (monotonic() + self.ttl, addresses)
+        return addresses
+
+    def resolve_all(self, hosts):
+        """Resolve many host names concurrently, up to ``pool_size`` at a
+        time, caching their addresses. Host names already cached are not
+        resolved again.
+
+        :param hosts: Host names to resolve
+        :type hosts: list(str)
+        :rtype: dict of host name to list of address tuples, without port,
+          or :py:class:`socket.gaierror` on resolution error"""
+        self._prune(monotonic())
+        results = {}
+        pool = gevent.pool.Pool(self.pool_size)
+        for host in set(hosts):
+            pool.spawn(self._lookup_into, host, results)
+        pool.join()
+        return results
+
+    def _prune(self, now):
+        """Remove expired entries from cache, at most once every ``ttl`` or
+        ``negative_ttl`` seconds, whichever is shorter"""
+        if now < self._next_prune:
+            return
+        self._next_prune = now + min(self.ttl, self.negative_ttl)
+        for host in [host for host, (expires, _) in self._cache.items()
+                     if expires <= now]:
+            del self._cache[host]
+
+    def _lookup_into(self, host, results):
+        try:
+            results[host] = self._lookup(host)
+        except sock_gaierror as ex:
+            results[host] = ex
+
+    def clear(self, host=None):
+        """Remove cached addresses and errors.
+
+        :param host: (Optional) Host name to remove. Defaults to ``None``
+          for all host names
+        :type host: str"""
+        if host is None:
+            self._cache.clear()
+            return
+        self._cache.pop(host, None)
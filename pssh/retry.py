@@ -0,0 +1,95 @@
+# This file is part of parallel-ssh.
+
+# Copyright (C) 2014-2017 Panos Kittenis
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation, version 2.1.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""Connection retry policy module of ParallelSSH"""
+
+from random import random
+
+from .constants import DEFAULT_RETRY_DELAY, DEFAULT_RETRY_MULTIPLIER, \
+     DEFAULT_RETRY_MAX_DELAY, DEFAULT_RETRY_JITTER
+
+
+class RetryPolicy(object):
+    """Delay between connection attempts.
+
+    Delay starts at ``delay`` seconds and is multiplied by ``multiplier`` on
+    each retry up to ``max_delay``. Each delay is then reduced by a random
+    amount of up to ``jitter`` times its value so that many clients failing
+    at the same time do not all retry at the same time."""
+
+    def __init__(self, delay=DEFAULT_RETRY_DELAY,
+                 multiplier=DEFAULT_RETRY_MULTIPLIER,
+                 max_delay=DEFAULT_RETRY_MAX_DELAY,
+                 jitter=DEFAULT_RETRY_JITTER, timeout=None):
+        """
+        :param delay: (Optional) Seconds to wait before first retry.
+          Defaults to 1.
+        :type delay: float
+        :param multiplier: (Optional) Factor to increase delay by on each
+          subsequent retry. Defaults to 2.
+        :type multiplier: float
+        :param max_delay: (Optional) Maximum seconds to wait between
+          retries. Defaults to 30.
+        :type max_delay: float
+        :param jitter: (Optional) Fraction, between zero and one, of each
+          delay to randomly subtract from it. Zero disables jitter.
+          Defaults to 0.5.
+        :type jitter: float
+        :param timeout: (Optional) Total seconds, since first connection
+          attempt, after which no more retries are made regardless of number
+          of retries left. Defaults to ``None`` for no limit.
+        :type timeout: float
+
+        **Example Usage**
+
+        .. code-block:: python
+
+          from pssh import ParallelSSHClient
+          from pssh.retry import RetryPolicy
+
+          retry_policy = RetryPolicy(delay=0.2, max_delay=10, timeout=60)
+          client = ParallelSSHClient(hosts, num_retries=10,
+                                     retry_policy=retry_policy)
+        """
+        if not 0 <= jitter <= 1:
+            raise ValueError("Jitter must be between zero and one - got %s"
+                             % (jitter,))
+        self.delay = delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.timeout = timeout
+
+    def get_delay(self, retries, elapsed=0):
+        """Get seconds to wait before next connection attempt.
+
+        :param retries: Number of attempts made so far, starting at one
+        :type retries: int
+        :param elapsed: Seconds since first connection attempt
+        :type elapsed: float
+        :rtype: float or ``None`` if ``timeout`` has been reached and no
+          more attempts should be made"""
+        delay = min(self.delay * self.multiplier ** (retries - 1),
+                    self.max_delay)
+        if self.jitter:
+            delay -= delay * self.jitter * random()
+        if self.timeout is not None:
+            remaining = self.timeout - elapsed
+            if remaining <= 0:
+                return
+            delay = min(delay, remaining)
+        return delay
@@ -20,15 +20,26 @@
 
 import os
 import logging
+from errno import ECONNREFUSED, EHOSTUNREACH
+import socket
 from socket import gaierror as sock_gaierror, error as sock_error
+from time import time
+from weakref import WeakValueDictionary
 
 from gevent import sleep
 import paramiko
 from paramiko.ssh_exception import ChannelException
+try:
+    from paramiko.ssh_exception import NoValidConnectionsError
+except ImportError:
+    # paramiko < 1.16
+    NoValidConnectionsError = None
 
 from .exceptions import UnknownHostException, AuthenticationException, \
      ConnectionErrorException, SSHException
-from .constants import DEFAULT_RETRIES
+from .constants import DEFAULT_RETRIES, DEFAULT_CHUNK_SIZE
+from .output import HostTiming
+from .retry import RetryPolicy
 from .utils import read_openssh_config
 
 host_logger = logging.getLogger('pssh.host_logger')
@@ -48,7 +59,9 @@ class SSHClient(object):
                  allow_agent=True, timeout=10, proxy_host=None,
                  proxy_port=22, proxy_user=None, proxy_password=None,
                  proxy_pkey=None, channel_timeout=None,
-                 _openssh_config_file=None,
+                 proxy_client=None, retry_policy=None, hooks=None,
+                 keepalive_seconds=None, resolver=None,
+                 _openssh_config_file=None, _sleep=None,
                  **paramiko_kwargs):
         """
         :param host: Hostname to connect to
@@ -93,6 +106,28 @@ class SSHClient(object):
         :param channel_timeout: (Optional) Time in seconds before an SSH
           operation times out.
         :type channel_timeout: int
+        :param proxy_client: (Optional) Already connected client to
+          ``proxy_host`` to open tunnel channel on. Allows many clients to
+          share a single proxy connection. A new connection to ``proxy_host``
+          is made if not provided or if provided client is no longer connected.
+        :type proxy_client: :py:class:`paramiko.SSHClient`
+        :param retry_policy: (Optional) Policy for delay between connection
+          attempts. Defaults to exponential back off with jitter starting at
+          one second - see :py:class:`pssh.retry.RetryPolicy`
+        :type retry_policy: :py:class:`pssh.retry.RetryPolicy`
+        :param hooks: (Optional) Hooks to call on connection, command and file
+          transfer events - see :py:class:`pssh.hooks.EventHooks`
+        :type hooks: :py:class:`pssh.hooks.EventHooks`
+        :param keepalive_seconds: (Optional) Send SSH keepalive messages
+          every this many seconds when connection is otherwise unused, so
+          that idle connections are kept open by firewalls and dead ones are
+          detected. Defaults to ``None`` for no keepalives
+        :type keepalive_seconds: int
+        :param resolver: (Optional) Caching resolver to resolve host name
+          with. Resolution errors are not retried when set, as the resolver
+          caches them. Defaults to ``None`` to resolve host name on every
+          connection attempt - see :py:class:`pssh.resolver.Resolver`
+        :type resolver: :py:class:`pssh.resolver.Resolver`
         :param allow_agent: (Optional) set to False to disable connecting to
           the SSH agent
         :type allow_agent: bool
@@ -106,10 +141,14 @@ class SSHClient(object):
         except TypeError:
             host, _user, _port, _pkey = host, None, 22, None
         user = user if user else _user
+        self._timing = HostTiming()
+        self.timing = None
         client = paramiko.SSHClient()
         client.set_missing_host_key_policy(paramiko.MissingHostKeyPolicy())
         self.forward_ssh_agent = forward_ssh_agent
         self.client = client
+        # Command channels, to tell if connection is in use
+        self._channels = WeakValueDictionary()
         self.user = user
         self.password = password
         self.pkey = pkey if pkey else _pkey
@@ -119,19 +158,42 @@ class SSHClient(object):
         if agent:
             self.client._agent = agent
         self.num_retries = num_retries
+        self.retry_policy = retry_policy if retry_policy else RetryPolicy()
+        self._sleep = _sleep if _sleep else sleep
+        self.hooks = hooks
+        self.resolver = resolver
+        self._started = time()
         self.timeout = timeout
         self.channel_timeout = channel_timeout
         self.proxy_host, self.proxy_port, self.proxy_user, \
             self.proxy_password, self.proxy_pkey = proxy_host, proxy_port, \
             proxy_user, proxy_password, proxy_pkey
-        self.proxy_client = None
-        if self.proxy_host and self.proxy_port:
-            logger.debug(
-                "Proxy configured for destination host %s - Proxy host: %s:%s",
-                self.host, self.proxy_host, self.proxy_port,)
-            self._connect_tunnel(**paramiko_kwargs)
-        else:
-            self._connect(self.client, self.host, self.port, **paramiko_kwargs)
+        self.proxy_client = proxy_client
+        # Seconds taken by successful connection attempt, excluding retries
+        self.connect_latency = None
+        self._timing.mark('start')
+        if self.hooks is not None:
+            self.hooks.connect_start(self.host, self.port)
+        try:
+            if self.proxy_host and self.proxy_port:
+                logger.debug(
+                    "Proxy configured for destination host %s - "
+                    "Proxy host: %s:%s",
+                    self.host, self.proxy_host, self.proxy_port,)
+                self._connect_tunnel(**paramiko_kwargs)
+            else:
+                self._connect(self.client, self.host, self.port,
+                              **paramiko_kwargs)
+        except Exception as ex:
+            if self.hooks is not None:
+                self.hooks.connect_end(self.host, self.port,
+                                       time() - self._started, exception=ex)
+            raise
+        if keepalive_seconds:
+            self.client.get_transport().set_keepalive(keepalive_seconds)
+        if self.hooks is not None:
+            self.hooks.connect_end(self.host, self.port,
+                                   time() - self._started)
 
     def _connect_tunnel(self, **paramiko_kwargs):
         """Connects to SSH server via an intermediate SSH tunnel server.
@@ -141,18 +203,22 @@ class SSHClient(object):
         :rtype: :py:class:`paramiko.SSHClient` Client to remote SSH destination
         via intermediate SSH tunnel server.
         """
-        self.proxy_client = paramiko.SSHClient()
-        self.proxy_client.set_missing_host_key_policy(
-            paramiko.MissingHostKeyPolicy())
-        self._connect(self.proxy_client, self.proxy_host, self.proxy_port,
-                      user=self.proxy_user, password=self.proxy_password,
-                      pkey=self.proxy_pkey, **paramiko_kwargs)
+        proxy_transport = self.proxy_client.get_transport() \
+            if self.proxy_client is not None else None
+        if proxy_transport is None or not proxy_transport.is_active():
+            self.proxy_client = paramiko.SSHClient()
+            self.proxy_client.set_missing_host_key_policy(
+                paramiko.MissingHostKeyPolicy())
+            self._connect(self.proxy_client, self.proxy_host, self.proxy_port,
+                          user=self.proxy_user, password=self.proxy_password,
+                          pkey=self.proxy_pkey, **paramiko_kwargs)
         logger.info("Connecting via SSH proxy %s:%s -> %s:%s", self.proxy_host,
                     self.proxy_port, self.host, self.port,)
         try:
             proxy_channel = self.proxy_client.get_transport().open_channel(
                 'direct-tcpip', (self.host, self.port,), ('127.0.0.1', 0),
                 timeout=self.timeout)
+            self._timing.mark('connected')
             sleep(0)
             return self._connect(self.client, self.host, self.port,
                                  sock=proxy_channel,
@@ -164,7 +230,7 @@ class SSHClient(object):
                 self.host, self.port, str(error_type))
 
     def _connect(self, client, host, port, sock=None, retries=1,
-                 user=None, password=None, pkey=None,
+                 user=None, password=None, pkey=None, _started=None,
                  **paramiko_kwargs):
         """Connect to host
 
@@ -177,22 +243,29 @@ class SSHClient(object):
         :raises: :py:class:`pssh.exceptions.SSHException` on other undefined
           SSH errors
         """
+        _started = _started if _started is not None else time()
+        timing = self._timing if client is self.client else None
+        attempt_started = time()
         try:
+            _sock = sock if sock is not None else self._open_socket(
+                host, port, timing=timing)
             client.connect(host,
                            username=user if user else self.user,
                            password=password if password else self.password,
                            port=port, pkey=pkey if pkey else self.pkey,
-                           sock=sock, timeout=self.timeout,
+                           sock=_sock, timeout=self.timeout,
                            allow_agent=self.allow_agent,
                            **paramiko_kwargs)
         except sock_gaierror as ex:
             logger.error("Could not resolve host '%s' - retry %s/%s",
                          host, retries, self.num_retries)
-            while retries < self.num_retries:
-                sleep(5)
+            if self.resolver is None \
+               and self._retry_wait(retries, _started, ex):
                 return self._connect(client, host, port,
                                      sock=sock,
                                      retries=retries+1,
+                                     user=user, password=password, pkey=pkey,
+                                     _started=_started,
                                      **paramiko_kwargs)
             raise UnknownHostException("Unknown host %s - %s - retry %s/%s",
                                        host, str(ex.args[1]), retries,
@@ -200,11 +273,12 @@ class SSHClient(object):
         except sock_error as ex:
             logger.error("Error connecting to host '%s:%s' - retry %s/%s",
                          self.host, self.port, retries, self.num_retries)
-            while retries < self.num_retries:
-                sleep(5)
+            if self._retry_wait(retries, _started, ex):
                 return self._connect(client, host, port,
                                      sock=sock,
                                      retries=retries+1,
+                                     user=user, password=password, pkey=pkey,
+                                     _started=_started,
                                      **paramiko_kwargs)
             error_type = ex.args[1] if len(ex.args) > 1 else ex.args[0]
             raise ConnectionErrorException(
@@ -212,6 +286,8 @@ class SSHClient(object):
                 self.host, self.port, str(error_type), retries,
                 self.num_retries,)
         except paramiko.AuthenticationException as ex:
+            if self.hooks is not None and client is self.client:
+                self.hooks.auth(host, port, False)
             msg = "Authentication error while connecting to %s:%s."
             raise AuthenticationException(msg, host, port)
         # SSHException is more general so should be below other types
@@ -220,6 +296,82 @@ class SSHClient(object):
             msg = "General SSH error - %s" % (ex,)
             logger.error(msg)
             raise SSHException(msg, host, port)
+        if timing is not None:
+            timing.mark('authenticated')
+            self.connect_latency = time() - attempt_started
+            if self.hooks is not None:
+                self.hooks.auth(host, port, True)
+
+    def _open_socket(self, host, port, timing=None):
+        """Resolve host name and connect to first address that accepts
+        connection, recording resolution and connection time in ``timing``
+        if provided"""
+        if self.resolver is not None:
+            addresses = self.resolver.resolve(host, port)
+        else:
+            addresses = socket.getaddrinfo(host, port, socket.AF_UNSPEC,
+                                           socket.SOCK_STREAM)
+        if timing is not None:
+            timing.mark('resolved')
+        errors = {}
+        for family, socktype, proto, _, address in addresses:
+            sock = socket.socket(family, socktype, proto)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(address)
+            except sock_error as ex:
+                sock.close()
+                if ex.errno not in (ECONNREFUSED, EHOSTUNREACH):
+                    raise
+                errors[address] = ex
+                continue
+            if timing is not None:
+                timing.mark('connected')
+            return sock
+        if NoValidConnectionsError is None:
+            raise sock_error(ECONNREFUSED, "Unable to connect to port %s on "
+                             "any address of %s" % (port, host))
+        raise NoValidConnectionsError(errors)
+
+    def _retry_wait(self, retries, started, exception):
+        """Wait before next connection attempt as per retry policy.
+
+        :rtype: bool - ``False`` if no more attempts should be made"""
+        if retries >= self.num_retries:
+            return False
+        delay = self.retry_policy.get_delay(retries, elapsed=time() - started)
+        if delay is None:
+            logger.error("Retry time limit of %s seconds reached for host "
+                         "'%s:%s'", self.retry_policy.timeout,
+                         self.host, self.port)
+            return False
+        logger.debug("Retrying connection to host '%s:%s' in %.2f seconds",
+                     self.host, self.port, delay)
+        if self.hooks is not None:
+            self.hooks.retry(self.host, self.port, retries, delay, exception)
+        self._sleep(delay)
+        return True
+
+    @property
+    def num_open_channels(self):
+        """Number of command channels still open on this connection"""
+        return len([channel for channel in self._channels.values()
+                    if not channel.closed])
+
+    @property
+    def is_alive(self):
+        """Whether connection to host is still active"""
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def close(self):
+        """Close connection to host"""
+        self.client.close()
+
+    def _reset_timing(self):
+        """Start new timing record for next command and return current one"""
+        timing, self._timing = self._timing, HostTiming()
+        return timing
 
     def exec_command(self, command, sudo=False, user=None,
                      shell=None,
@@ -251,8 +403,20 @@ class SSHClient(object):
           been got, hostname is remote hostname the copy is to, stdout and
           stderr are buffers containing command output and stdin is standard
           input channel
+
+        Timestamps of connection and command phases are recorded in
+        ``self.timing`` - see :py:class:`pssh.output.HostTiming`
         """
+        # Connection phases are only part of first command on connection
+        timing = self._reset_timing()
+        self.timing = timing
+        timing.mark('exec_started')
         channel = self.client.get_transport().open_session()
+        timing.mark('channel_opened')
+        self._channels[id(channel)] = channel
+        if self.hooks is not None:
+            self.hooks.channel_open(
+                self.host, timing.channel_opened - timing.exec_started)
         if self.forward_ssh_agent:
             agent_handler = paramiko.agent.AgentRequestHandler(  # noqa: F841
                 channel)
@@ -276,6 +440,7 @@ class SSHClient(object):
             _command += '"%s"' % (command,)
         logger.debug("Running parsed command %s on %s", _command, self.host)
         channel.exec_command(_command)
+        timing.mark('command_sent')
         logger.debug("Command started")
         sleep(0)
         return channel, self.host, stdout, stderr, stdin
@@ -283,7 +448,8 @@ class SSHClient(object):
     def read_output_buffer(self, output_buffer, prefix='',
                            callback=None,
                            callback_args=None,
-                           encoding='utf-8'):
+                           encoding='utf-8', stream='stdout',
+                           on_output=None, timing=None):
         """Read from output buffers and log to host_logger
 
         :param output_buffer: Iterator containing buffer
@@ -294,14 +460,73 @@ class SSHClient(object):
         :type callback: function
         :param callback_args: Arguments for call back function
         :type callback_args: tuple
+        :param stream: (Optional) Name of stream being read, ``stdout`` or
+          ``stderr``, for event hooks
+        :type stream: str
+        :param on_output: (Optional) Function to call with host and each line
+          of output as it is read, instead of logging to ``host_logger``
+        :type on_output: function
+        :param timing: (Optional) Timing record of command to record time
+          first output is read in, as ``first_byte``
+        :type timing: :py:class:`pssh.output.HostTiming`
         """
         for line in output_buffer:
+            if timing is not None:
+                timing.mark('first_byte')
+            if self.hooks is not None:
+                self.hooks.bytes_read(self.host, stream, len(line))
             output = line.strip().decode(encoding)
-            host_logger.info("[%s]%s\t%s", self.host, prefix, output,)
+            if on_output is not None:
+                on_output(self.host, output)
+            else:
+                host_logger.info("[%s]%s\t%s", self.host, prefix, output,)
             yield output
         if callback:
             callback(*callback_args)
 
+    def read_output_chunks(self, channel, stream='stdout', callback=None,
+                           callback_args=None,
+                           chunk_size=DEFAULT_CHUNK_SIZE, on_output=None,
+                           timing=None):
+        """Read raw output from channel in chunks as received.
+
+        Output is not decoded, split into lines or logged to ``host_logger``.
+        Use :py:func:`pssh.utils.iter_lines` to split chunks into lines.
+
+        :param channel: Channel to read from
+        :type channel: :py:class:`paramiko.channel.Channel`
+        :param stream: (Optional) Stream to read, ``stdout`` or ``stderr``.
+          Defaults to ``stdout``
+        :type stream: str
+        :param callback: Function to call back once output is depleted
+        :type callback: function
+        :param callback_args: Arguments for call back function
+        :type callback_args: tuple
+        :param chunk_size: (Optional) Maximum size of each chunk
+        :type chunk_size: int
+        :param on_output: (Optional) Function to call with host and each
+          chunk of output as it is read
+        :type on_output: function
+        :param timing: (Optional) Timing record of command to record time
+          first output is read in, as ``first_byte``
+        :type timing: :py:class:`pssh.output.HostTiming`
+        :rtype: generator of bytes
+        """
+        recv = channel.recv_stderr if stream == 'stderr' else channel.recv
+        while True:
+            data = recv(chunk_size)
+            if not data:
+                break
+            if timing is not None:
+                timing.mark('first_byte')
+            if self.hooks is not None:
+                self.hooks.bytes_read(self.host, stream, len(data))
+            if on_output is not None:
+                on_output(self.host, data)
+            yield data
+        if callback:
+            callback(*callback_args)
+
     def _make_sftp(self):
         """Make SFTP client from open transport"""
         transport = self.client.get_transport()
@@ -399,13 +624,18 @@ class SSHClient(object):
         except IOError:
             self.mkdir(sftp, destination)
         sftp.chdir()
+        started = time()
         try:
-            sftp.put(local_file, remote_file)
+            attrs = sftp.put(local_file, remote_file)
         except Exception as error:
             logger.error("Error occured copying file %s to remote destination "
                          "%s:%s - %s",
                          local_file, self.host, remote_file, error)
             raise error
+        if self.hooks is not None:
+            self.hooks.file_transferred(
+                self.host, local_file, remote_file, attrs.st_size,
+                time() - started, 'upload')
         logger.info("Copied local file %s to remote destination %s:%s",
                     local_file, self.host, remote_file)
 
@@ -442,6 +672,7 @@ class SSHClient(object):
                                          local_file, sftp)
         destination = self._parent_paths_split(local_file)
         self._make_local_dir(destination)
+        started = time()
         try:
             sftp.get(remote_file, local_file)
         except Exception as error:
@@ -449,6 +680,10 @@ class SSHClient(object):
                          " %s:%s - %s",
                          local_file, self.host, remote_file, error)
             raise
+        if self.hooks is not None:
+            self.hooks.file_transferred(
+                self.host, local_file, remote_file,
+                os.path.getsize(local_file), time() - started, 'download')
         logger.info("Copied local file %s from remote destination %s:%s",
                     local_file, self.host, remote_file)
 
@@ -21,7 +21,10 @@
 
 import logging
 import os
+import sys
 
+import gevent
+from gevent.queue import JoinableQueue, Full
 from paramiko.rsakey import RSAKey
 from paramiko.dsskey import DSSKey
 from paramiko.ecdsakey import ECDSAKey
@@ -29,37 +32,205 @@ from paramiko import SSHException, SSHConfig
 
 host_logger = logging.getLogger('pssh.host_logger')
 logger = logging.getLogger('pssh')
+# Parsed OpenSSH config and loaded private keys by file path, shared by all
+# clients in the process - values are tuples of (file stat, value)
+_SSH_CONFIG_CACHE = {}
+_PRIVATE_KEY_CACHE = {}
 
 
-def enable_logger(_logger, level=logging.INFO):
-    """Enables logging to stdout for given logger"""
-    stream_handlers = [h for h in _logger.handlers
-                       if isinstance(h, logging.StreamHandler)]
-    if stream_handlers:
-        logger.warning("Logger already has a StreamHandler attached")
+class AsyncHostLogHandler(logging.Handler):
+    """Logging handler that writes records to a stream in batches from a
+    background greenlet.
+
+    Records are queued by the greenlet logging them and written by a writer
+    greenlet, with the write itself done in gevent's thread pool, so that a
+    slow terminal or pipe does not hold up reading of remote output.
+
+    With ``policy='drop'``, records logged while the queue is full are
+    dropped and counted in ``dropped``. With ``policy='block'``, the
+    greenlet logging the record waits for space in the queue instead.
+    """
+
+    DROP = 'drop'
+    BLOCK = 'block'
+
+    def __init__(self, stream=None, max_queue=10000, policy=DROP,
+                 batch_size=1000):
+        """
+        :param stream: (Optional) Stream to write to. Defaults to
+          ``sys.stderr``
+        :type stream: file
+        :param max_queue: (Optional) Maximum number of records to queue
+        :type max_queue: int
+        :param policy: (Optional) What to do when queue is full - ``drop`` or
+          ``block``. Defaults to ``drop``
+        :type policy: str
+        :param batch_size: (Optional) Maximum number of records to write at
+          once
+        :type batch_size: int
+        :raises: :py:class:`ValueError` on unknown policy
+        """
+        if policy not in (self.DROP, self.BLOCK):
+            raise ValueError("Unknown queue policy %s" % (policy,))
+        logging.Handler.__init__(self)
+        self.stream = stream if stream is not None else sys.stderr
+        self.policy = policy
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue = JoinableQueue(max_queue)
+        self._writer = None
+
+    def emit(self, record):
+        if self._writer is None:
+            self._writer = gevent.spawn(self._write_batches)
+        try:
+            self._queue.put(record, block=self.policy == self.BLOCK)
+        except Full:
+            self.dropped += 1
+
+    def _write_batches(self):
+        pool = gevent.get_hub().threadpool
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get())
+            try:
+                data = ''.join(['%s\n' % (self.format(record),)
+                                for record in batch])
+                pool.apply(self._write, (data,))
+            except Exception:
+                self.handleError(batch[0])
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, data):
+        self.stream.write(data)
+        self.stream.flush()
+
+    def flush(self):
+        """Wait until all queued records have been written"""
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.kill()
+            self._writer = None
+        logging.Handler.close(self)
+
+
+def enable_logger(_logger, level=logging.INFO, handler=None):
+    """Enables logging to stdout for given logger
+
+    Does nothing if logger already has a handler attached, other than a
+    :py:class:`logging.NullHandler`, and no handler is given. A given handler
+    replaces any handler attached by a previous call - handlers attached
+    otherwise, for example by the application, are left in place.
+
+    :param handler: (Optional) Handler to log with instead of a
+      :py:class:`logging.StreamHandler`
+    :type handler: :py:class:`logging.Handler`"""
+    null_handler = getattr(logging, 'NullHandler', ())
+    existing_handlers = [h for h in _logger.handlers
+                         if not isinstance(h, null_handler)]
+    if handler is None:
+        if existing_handlers:
+            logger.warning("Logger already has a %s attached",
+                           existing_handlers[0].__class__.__name__)
+            return
+        handler = logging.StreamHandler()
+    elif handler in existing_handlers:
         return
-    handler = logging.StreamHandler()
+    for existing_handler in existing_handlers:
+        if getattr(existing_handler, '_pssh_enabled', False):
+            existing_handler.flush()
+            _logger.removeHandler(existing_handler)
+    handler._pssh_enabled = True
     host_log_format = logging.Formatter('%(message)s')
     handler.setFormatter(host_log_format)
     _logger.addHandler(handler)
     _logger.setLevel(level)
 
 
-def enable_host_logger():
+def enable_host_logger(handler=None):
     """Enable host logger for logging stdout from remote commands
     as it becomes available.
 
+    :param handler: (Optional) Handler to log with, for example
+      :py:class:`AsyncHostLogHandler` to not hold up reading of output on
+      writes to a slow terminal or pipe. Defaults to logging to stderr with
+      a :py:class:`logging.StreamHandler`
+    :type handler: :py:class:`logging.Handler`
     """
-    enable_logger(host_logger)
+    enable_logger(host_logger, handler=handler)
+
+
+def clear_config_cache():
+    """Clear cached OpenSSH configuration and private keys.
+
+    Parsed OpenSSH config files and private keys loaded from file names are
+    cached for the life time of the process and re-loaded automatically when
+    the file's modification time changes. Call this to force them to be
+    re-loaded regardless, for example after replacing a key file in place
+    with the same modification time."""
+    _SSH_CONFIG_CACHE.clear()
+    _PRIVATE_KEY_CACHE.clear()
+
+
+def _file_stat(file_name):
+    stat = os.stat(file_name)
+    return stat.st_mtime, stat.st_size
+
+
+def iter_lines(chunks, keepends=False):
+    """Split chunks of raw output into lines.
+
+    Lines may span chunks - a line is yielded once its line ending, or the
+    end of output, has been read.
+
+    :param chunks: Output chunks as produced with ``raw_output`` enabled on
+      :py:func:`pssh.pssh_client.ParallelSSHClient.run_command`
+    :type chunks: iterable of bytes
+    :param keepends: (Optional) Keep line endings. Defaults to ``False``
+    :type keepends: bool
+    :rtype: generator of bytes"""
+    partial = b''
+    for chunk in chunks:
+        lines = (partial + chunk).split(b'\n')
+        partial = lines.pop()
+        for line in lines:
+            yield line + b'\n' if keepends else line.rstrip(b'\r')
+    if partial:
+        yield partial if keepends else partial.rstrip(b'\r')
 
 
 def load_private_key(_pkey):
     """Load private key from pkey file object or filename
 
+    Keys loaded from file names are cached per file name and modification
+    time - see :py:func:`clear_config_cache`
+
     :param pkey: File object or file name containing private key
     :type pkey: file/str"""
-    if not hasattr(_pkey, 'read'):
-        _pkey = open(_pkey)
+    if hasattr(_pkey, 'read'):
+        return _load_private_key(_pkey)
+    stat = _file_stat(_pkey)
+    try:
+        _stat, pkey = _PRIVATE_KEY_CACHE[_pkey]
+    except KeyError:
+        pass
+    else:
+        if _stat == stat:
+            return pkey
+    with open(_pkey) as fh:
+        pkey = _load_private_key(fh)
+    _PRIVATE_KEY_CACHE[_pkey] = (stat, pkey)
+    return pkey
+
+
+def _load_private_key(_pkey):
     for keytype in [RSAKey, DSSKey, ECDSAKey]:
         try:
             pkey = keytype.from_private_key(_pkey)
@@ -72,21 +243,56 @@ def load_private_key(_pkey):
                  "- giving up..")
 
 
+def _load_ssh_config(config_file):
+    stat = _file_stat(config_file)
+    try:
+        _stat, ssh_config = _SSH_CONFIG_CACHE[config_file]
+    except KeyError:
+        pass
+    else:
+        if _stat == stat:
+            return ssh_config
+    ssh_config = SSHConfig()
+    with open(config_file) as fh:
+        ssh_config.parse(fh)
+    _SSH_CONFIG_CACHE[config_file] = (stat, ssh_config)
+    return ssh_config
+
+
+def _lookup_ssh_config(_host, config_file=None):
+    _ssh_config_file = config_file if config_file else \
+        os.path.sep.join([os.path.expanduser('~'), '.ssh', 'config'])
+    if not os.path.isfile(_ssh_config_file):
+        return
+    return _load_ssh_config(_ssh_config_file).lookup(_host)
+
+
+def read_openssh_hostname(_host, config_file=None):
+    """Host address to connect to for hostname as set by ``HostName`` in
+    user's OpenSSH config, without loading any other configuration
+
+    :param _host: Hostname to lookup in config
+    :rtype: str - ``_host`` if no host address is set"""
+    host_config = _lookup_ssh_config(_host, config_file=config_file)
+    if host_config is None:
+        return _host
+    return host_config.get('hostname', _host)
+
+
 def read_openssh_config(_host, config_file=None):
     """Parses user's OpenSSH config for per hostname configuration for
     hostname, user, port and private key values
 
+    Parsed configuration is cached per file name and modification time -
+    see :py:func:`clear_config_cache`
+
     :param _host: Hostname to lookup in config
     """
-    _ssh_config_file = config_file if config_file else \
-        os.path.sep.join([os.path.expanduser('~'), '.ssh', 'config'])
     # Load ~/.ssh/config if it exists to pick up username
     # and host address if set
-    if not os.path.isfile(_ssh_config_file):
+    host_config = _lookup_ssh_config(_host, config_file=config_file)
+    if host_config is None:
         return
-    ssh_config = SSHConfig()
-    ssh_config.parse(open(_ssh_config_file))
-    host_config = ssh_config.lookup(_host)
     host = (host_config['hostname'] if
             'hostname' in host_config
             else _host)
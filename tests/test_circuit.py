@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+# This file is part of parallel-ssh.
+
+# Copyright (C) 2015- Panos Kittenis
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation, version 2.1.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+"""Unittests for :mod:`pssh.circuit.CircuitBreaker` class"""
+
+
+import unittest
+from pssh.circuit import CircuitBreaker
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(threshold=3, cooldown=60)
+        for _ in range(2):
+            breaker.record_failure('host')
+            self.assertTrue(breaker.allow('host'))
+            self.assertEqual(breaker.state('host'), CircuitBreaker.CLOSED)
+        breaker.record_failure('host')
+        self.assertFalse(breaker.allow('host'))
+        self.assertEqual(breaker.state('host'), CircuitBreaker.OPEN)
+        self.assertTrue(breaker.allow('other_host'))
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker(threshold=2)
+        breaker.record_failure('host')
+        breaker.record_success('host')
+        breaker.record_failure('host')
+        self.assertTrue(breaker.allow('host'))
+        self.assertEqual(breaker.failures('host'), 1)
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0)
+        breaker.record_failure('host')
+        self.assertEqual(breaker.state('host'), CircuitBreaker.HALF_OPEN)
+        breaker.cooldown = 60
+        breaker._opened['host'] -= 60
+        # Only one probe allowed through at a time
+        self.assertTrue(breaker.allow('host'))
+        self.assertFalse(breaker.allow('host'))
+        self.assertEqual(breaker.state('host'), CircuitBreaker.HALF_OPEN)
+        # Failed probe re-opens circuit for another cooldown
+        breaker.record_failure('host')
+        self.assertEqual(breaker.state('host'), CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow('host'))
+        breaker._opened['host'] -= 60
+        self.assertTrue(breaker.allow('host'))
+        breaker.record_success('host')
+        self.assertEqual(breaker.state('host'), CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow('host'))
+
+    def test_reset(self):
+        breaker = CircuitBreaker(threshold=1)
+        breaker.record_failure('host1')
+        breaker.record_failure('host2')
+        breaker.reset('host1')
+        self.assertTrue(breaker.allow('host1'))
+        self.assertFalse(breaker.allow('host2'))
+        breaker.reset()
+        self.assertTrue(breaker.allow('host2'))
+        self.assertEqual(breaker.failures('host2'), 0)
+
+    def test_invalid_args(self):
+        self.assertRaises(ValueError, CircuitBreaker, threshold=0)
+        self.assertRaises(ValueError, CircuitBreaker, cooldown=-1)
+
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+# This file is part of parallel-ssh.
+
+# Copyright (C) 2015- Panos Kittenis
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation, version 2.1.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+
+"""Unittests for :mod:`pssh.hooks` module"""
+
+
+import unittest
+from pssh.hooks import EventHooks, MetricsHooks, Histogram
+
+
+class TestMetricsHooks(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = MetricsHooks(buckets=(0.1, 1))
+
+    def test_base_hooks(self):
+        hooks = EventHooks()
+        hooks.connect_start('host', 22)
+        hooks.connect_end('host', 22, 1, exception=Exception())
+        hooks.command_exit('host', 0, None)
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=(1, 0.1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value)
+        self.assertEqual(histogram.buckets, (0.1, 1))
+        self.assertEqual(histogram.counts, [1, 2])
+        self.assertEqual(histogram.count, 3)
+        self.assertEqual(histogram.sum, 5.55)
+
+    def test_counters(self):
+        self.metrics.connect_end('host', 22, 0.05)
+        self.metrics.connect_end('host', 22, 1, exception=Exception())
+        self.metrics.bytes_read('host', 'stdout', 10)
+        self.metrics.bytes_read('host', 'stdout', 5)
+        self.metrics.command_exit('host', 0, 0.5)
+        self.metrics.file_transferred('host', 'local', 'remote', 100, 0.2,
+                                      'upload')
+        counters = self.metrics.counters
+        self.assertEqual(counters[('pssh_connects_total',
+                                   (('result', 'success'),))], 1)
+        self.assertEqual(counters[('pssh_connects_total',
+                                   (('result', 'error'),))], 1)
+        self.assertEqual(counters[('pssh_read_bytes_total',
+                                   (('stream', 'stdout'),))], 15)
+        self.assertEqual(counters[('pssh_transferred_bytes_total',
+                                   (('direction', 'upload'),))], 100)
+        self.assertEqual(
+            self.metrics.histograms[
+                ('pssh_connect_duration_seconds', ())].count, 1)
+
+    def test_prometheus(self):
+        self.metrics.connect_end('host', 22, 0.05)
+        self.metrics.command_exit('host', 1, 0.5)
+        text = self.metrics.to_prometheus()
+        lines = text.splitlines()
+        self.assertTrue('# TYPE pssh_connects_total counter' in lines)
+        self.assertTrue('pssh_connects_total{result="success"} 1' in lines)
+        self.assertTrue('pssh_command_exits_total{exit_code="1"} 1' in lines)
+        self.assertTrue(
+            '# TYPE pssh_command_duration_seconds histogram' in lines)
+        self.assertTrue(
+            'pssh_command_duration_seconds_bucket{le="0.1"} 0' in lines)
+        self.assertTrue(
+            'pssh_command_duration_seconds_bucket{le="1.0"} 1' in lines)
+        self.assertTrue(
+            'pssh_command_duration_seconds_bucket{le="+Inf"} 1' in lines)
+        self.assertTrue('pssh_command_duration_seconds_count 1' in lines)
+        self.assertTrue(text.endswith('\n'))
+
+    def test_wsgi_app(self):
+        self.metrics.connect_end('host', 22, 0.05)
+        responses = []
+        body = self.metrics.wsgi_app(
+            {}, lambda status, headers: responses.append((status, headers)))
+        self.assertEqual(responses[0][0], '200 OK')
+        self.assertEqual(b''.join(body).decode('utf-8'),
+                         self.metrics.to_prometheus())
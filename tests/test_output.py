@@ -21,8 +21,22 @@
 """Unittests for :mod:`pssh.output.HostOutput` class"""
 
 
+import json
+import os
+import tempfile
 import unittest
-from pssh.output import HostOutput
+
+import gevent
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+from pssh import output as output_module
+from pssh.constants import DEFAULT_CHUNK_SIZE
+from pssh.output import HostOutput, HostTiming, timing_summary, \
+     OutputBuffer, Retention, SpoolFile, StreamBuffer, group_output, \
+     JSONLinesWriter, RunResult
+from pssh.exceptions import ConnectionErrorException, SSHException
 
 
 class TestHostOutput(unittest.TestCase):
@@ -58,3 +72,372 @@ class TestHostOutput(unittest.TestCase):
         self.assertEqual(self.output.exit_code, self.output['exit_code'])
         self.assertEqual(exception, self.output.exception)
         self.assertEqual(self.output.exception, self.output['exception'])
+
+    def test_mapping(self):
+        output = HostOutput('host', None, None, None, None, None,
+                            exit_code=0)
+        self.assertFalse(hasattr(output, '__dict__'))
+        self.assertEqual(output['exit_code'], 0)
+        self.assertTrue('exit_code' in output)
+        self.assertEqual(dict(output)['host'], 'host')
+        self.assertEqual(sorted(output.keys()), sorted(HostOutput.__slots__))
+        self.assertEqual(output.get('bad'), None)
+        self.assertRaises(KeyError, output.__getitem__, 'bad')
+        output.exit_code = 1
+        self.assertEqual(output['exit_code'], 1)
+        self.assertTrue(isinstance(output, Mapping))
+        self.assertEqual(output, dict(output))
+        self.assertEqual(dict(output.items()), dict(output))
+        self.assertEqual(output.values()[0], 'host')
+
+
+class TestRunResult(unittest.TestCase):
+
+    def test_run_result(self):
+        exception = ValueError()
+        output = {
+            'host1': HostOutput('host1', None, None, None, None, None,
+                                exit_code=0,
+                                timing=HostTiming(command_sent=1, exited=3)),
+            'host2': HostOutput('host2', None, None, None, None, None,
+                                exit_code=2),
+            'host3': HostOutput('host3', None, None, None, None, None,
+                                exception=exception),
+            'host4': HostOutput('host4', None, None, None, None, None),
+            }
+        result = RunResult.from_output(output)
+        self.assertEqual(len(result), 4)
+        self.assertEqual(result.exit_code('host1'), 0)
+        self.assertEqual(result.exit_code('host2'), 2)
+        self.assertEqual(result.exit_code('host4'), None)
+        self.assertEqual(result.exception('host3'), exception)
+        self.assertEqual(result.exception('host1'), None)
+        self.assertEqual(result.duration('host1', 'command'), 2)
+        self.assertEqual(result.duration('host2', 'command'), None)
+        self.assertEqual(sorted(result.failed_hosts()), ['host2', 'host3'])
+        self.assertRaises(KeyError, result.exit_code, 'bad')
+        self.assertEqual(result.exit_code_histogram(),
+                         {0: 1, 2: 1, None: 2})
+        self.assertEqual(result.exception_counts(), {'ValueError': 1})
+
+    def test_statistics(self):
+        output = dict(
+            ('host%s' % (i,), HostOutput(
+                'host%s' % (i,), None, None, None, None, None, exit_code=0,
+                timing=HostTiming(command_sent=0, exited=i)))
+            for i in range(1, 101))
+        output['host0'] = HostOutput('host0', None, None, None, None, None)
+        result = RunResult.from_output(output)
+        self.assertEqual(result.percentiles(),
+                         {'p50': 50, 'p95': 95, 'p99': 99})
+        self.assertEqual(result.percentiles('connect'), {})
+        self.assertEqual(result.slowest(2), [('host100', 100),
+                                             ('host99', 99)])
+        self.assertEqual(result.failed_hosts(), [])
+
+
+class TestHostTiming(unittest.TestCase):
+
+    def test_durations(self):
+        timing = HostTiming(start=1, resolved=1.5, connected=2,
+                            authenticated=3.5,
+                            exec_started=4, channel_opened=4.25,
+                            command_sent=4.5, first_byte=5)
+        durations = timing.durations()
+        self.assertEqual(durations['dns'], 0.5)
+        self.assertEqual(durations['connect'], 0.5)
+        self.assertEqual(durations['auth'], 1.5)
+        self.assertTrue('kex' not in durations)
+        self.assertEqual(durations['channel_open'], 0.25)
+        self.assertEqual(durations['exec'], 0.25)
+        self.assertEqual(durations['first_byte'], 0.5)
+        self.assertEqual(durations['command'], None)
+        timing.mark('exited')
+        self.assertTrue(timing.durations()['command'] > 0)
+        # Already set timestamps are not overwritten
+        timing.mark('start')
+        self.assertEqual(timing.start, 1)
+
+    def test_no_resolution(self):
+        timing = HostTiming(start=1, connected=2)
+        self.assertEqual(timing.durations()['dns'], None)
+        self.assertEqual(timing.durations()['connect'], 1)
+
+    def test_timing_summary(self):
+        timings = [HostTiming(exec_started=0, channel_opened=duration)
+                   for duration in range(1, 101)]
+        summary = timing_summary(timings + [None])
+        self.assertEqual(list(summary.keys()), ['channel_open'])
+        stats = summary['channel_open']
+        self.assertEqual(stats['count'], 100)
+        self.assertEqual(stats['min'], 1)
+        self.assertEqual(stats['max'], 100)
+        self.assertEqual(stats['mean'], 50.5)
+        self.assertEqual(stats['p50'], 50)
+        self.assertEqual(stats['p90'], 90)
+        self.assertEqual(stats['p99'], 99)
+
+
+class TestOutputBuffer(unittest.TestCase):
+
+    def test_tail_lines(self):
+        buffer = Retention(lines=3).make_buffer()
+        buffer.fill(str(i) for i in range(10))
+        self.assertTrue(buffer.done)
+        self.assertEqual(list(buffer), ['7', '8', '9'])
+        # Can iterate again
+        self.assertEqual(list(buffer), ['7', '8', '9'])
+        self.assertEqual(buffer.num_lines, 10)
+        self.assertEqual(buffer.dropped, 7)
+
+    def test_head_lines(self):
+        buffer = OutputBuffer(max_lines=3, keep='head')
+        buffer.fill(str(i) for i in range(10))
+        self.assertEqual(list(buffer), ['0', '1', '2'])
+        self.assertEqual(buffer.dropped, 7)
+
+    def test_max_bytes(self):
+        buffer = OutputBuffer(max_bytes=5)
+        buffer.fill(['aa', 'bb', 'cc', 'd'])
+        self.assertEqual(list(buffer), ['bb', 'cc', 'd'])
+        buffer = OutputBuffer(max_bytes=5, keep='head')
+        buffer.fill(['aa', 'bb', 'cc', 'd'])
+        self.assertEqual(list(buffer), ['aa', 'bb'])
+        # No lines are kept after first one dropped, even if they would fit
+        buffer = OutputBuffer(max_bytes=10, keep='head')
+        buffer.fill(['aaaaaaaa', 'bbbbbbbb', 'c', 'd'])
+        self.assertEqual(list(buffer), ['aaaaaaaa'])
+        self.assertEqual(buffer.dropped, 3)
+        buffer = OutputBuffer(max_bytes=0)
+        buffer.fill(['a'])
+        self.assertEqual(list(buffer), [])
+        self.assertRaises(ValueError, OutputBuffer, max_bytes=-1)
+        self.assertRaises(ValueError, Retention, max_bytes=-1)
+        # Size of decoded lines is counted in encoded bytes
+        buffer = OutputBuffer(max_bytes=6)
+        buffer.fill([u'\u00e9\u00e9', u'\u00e8\u00e8', u'aa'])
+        self.assertEqual(list(buffer), [u'\u00e8\u00e8', u'aa'])
+        self.assertEqual(buffer.num_bytes, 10)
+        buffer = OutputBuffer(max_bytes=4, encoding='latin-1')
+        buffer.fill([u'\u00e9\u00e9', u'\u00e8\u00e8'])
+        self.assertEqual(len(buffer), 2)
+
+    def test_unbounded(self):
+        buffer = OutputBuffer()
+        buffer.fill(str(i) for i in range(100))
+        self.assertEqual(len(buffer), 100)
+        self.assertEqual(buffer.dropped, 0)
+
+    def test_exception(self):
+        def output():
+            yield 'line'
+            raise IOError()
+        buffer = OutputBuffer()
+        buffer.fill(output())
+        self.assertRaises(IOError, list, buffer)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, Retention, keep='middle')
+        self.assertRaises(ValueError, OutputBuffer, max_lines=0)
+
+
+class TestSpoolFile(unittest.TestCase):
+
+    def setUp(self):
+        _fh, self.path = tempfile.mkstemp()
+        os.close(_fh)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_spool(self):
+        spool = SpoolFile(self.path)
+        spool.fill([b'line one\r\nline ', b'two\n', b'last'])
+        self.assertTrue(spool.done)
+        self.assertEqual(spool.num_bytes, 23)
+        with open(self.path, 'rb') as fh:
+            self.assertEqual(fh.read(), b'line one\r\nline two\nlast')
+        self.assertEqual(list(spool), ['line one', 'line two', 'last'])
+        self.assertEqual(list(spool.iter_lines(keepends=True)),
+                         [b'line one\r\n', b'line two\n', b'last'])
+        view = spool.view()
+        self.assertEqual(view[5:8].tobytes(), b'one')
+        view.release()
+
+    def test_empty(self):
+        spool = SpoolFile(self.path)
+        spool.fill([])
+        self.assertEqual(spool.mmap(), None)
+        self.assertEqual(len(spool.view()), 0)
+        self.assertEqual(list(spool), [])
+
+    def test_exception(self):
+        def output():
+            yield b'data'
+            raise IOError()
+        spool = SpoolFile(self.path)
+        spool.fill(output())
+        self.assertRaises(IOError, spool.view)
+
+
+class TestGroupOutput(unittest.TestCase):
+
+    def test_group_output(self):
+        output = {
+            'host1': HostOutput('host1', None, None, iter(['a', 'b']),
+                                iter([]), None),
+            'host2': HostOutput('host2', None, None, iter(['a', 'b']),
+                                iter([]), None),
+            'host3': HostOutput('host3', None, None, iter(['a']),
+                                iter(['b']), None),
+            'host4': HostOutput('host4', None, None, None, None, None,
+                                exception=Exception()),
+            }
+        groups = group_output(output)
+        self.assertEqual(len(groups), 2)
+        self.assertEqual(sorted(groups[0].hosts), ['host1', 'host2'])
+        self.assertEqual(groups[0].stdout, ['a', 'b'])
+        self.assertEqual(groups[0].stderr, [])
+        self.assertEqual(groups[1].hosts, ['host3'])
+        self.assertEqual(groups[1].stderr, ['b'])
+        self.assertNotEqual(groups[0].digest, groups[1].digest)
+
+    def test_group_output_one_copy(self):
+        num_lines, num_hosts = 20000, 4
+        spools = []
+
+        class _RecordingSpool(output_module._OutputSpool):
+            def __init__(self):
+                super(_RecordingSpool, self).__init__()
+                self.max_pending = 0
+                self.num_loads = 0
+                spools.append(self)
+
+            def append(self, item):
+                super(_RecordingSpool, self).append(item)
+                self.max_pending = max(self.max_pending, len(self._pending))
+
+            def load(self):
+                self.num_loads += 1
+                return super(_RecordingSpool, self).load()
+
+        def host_stdout():
+            for i in range(num_lines):
+                yield 'line %s %s' % (i, 'x' * 100)
+                if not i % 1000:
+                    gevent.sleep(0)
+        output = dict(
+            (host, HostOutput(host, None, None, host_stdout(), iter([]),
+                              None))
+            for host in ['host%s' % (i,) for i in range(num_hosts)])
+        _spool = output_module._OutputSpool
+        output_module._OutputSpool = _RecordingSpool
+        try:
+            groups = group_output(output)
+        finally:
+            output_module._OutputSpool = _spool
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(len(groups[0].hosts), num_hosts)
+        self.assertEqual(groups[0].stdout, list(host_stdout()))
+        # Output is read into memory in batches of at most one chunk and
+        # only first host's output of the group is loaded back into memory
+        self.assertEqual(len(spools), num_hosts * 2)
+        for spool in spools:
+            self.assertTrue(spool.max_pending <= DEFAULT_CHUNK_SIZE // 100)
+        self.assertEqual(sum(spool.num_loads for spool in spools), 2)
+        self.assertEqual(
+            sum(1 for spool in spools if os.path.exists(spool.path)), 0)
+
+
+class TestStreamBuffer(unittest.TestCase):
+
+    def test_stream(self):
+        def output():
+            for i in range(3):
+                gevent.sleep(0.01)
+                yield str(i)
+        buffer = StreamBuffer()
+        filler = gevent.spawn(buffer.fill, output())
+        readers = [gevent.spawn(list, buffer) for _ in range(2)]
+        gevent.sleep(0.015)
+        self.assertFalse(buffer.done)
+        self.assertEqual(len(buffer), 1)
+        gevent.joinall(readers + [filler], timeout=1)
+        for reader in readers:
+            self.assertEqual(reader.get(timeout=0), ['0', '1', '2'])
+        self.assertEqual(list(buffer), ['0', '1', '2'])
+
+    def test_exception(self):
+        def output():
+            yield 'line'
+            raise IOError()
+        buffer = StreamBuffer()
+        buffer.fill(output())
+        lines = []
+        try:
+            for line in buffer:
+                lines.append(line)
+        except IOError:
+            pass
+        else:
+            raise AssertionError("No exception raised")
+        self.assertEqual(lines, ['line'])
+
+
+class TestJSONLinesWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.outputs = [
+            HostOutput('host1', None, None, iter(['a', 'b']), iter([]), None,
+                       exit_code=0, timing=HostTiming(command_sent=1, exited=3)),
+            HostOutput('host2', None, None, None, None, None,
+                       exception=ValueError('bad host')),
+        ]
+
+    def _read(self, fh):
+        fh.seek(0)
+        return [json.loads(line) for line in fh.read().splitlines()]
+
+    def test_write_lines(self):
+        with tempfile.TemporaryFile('w+') as fh:
+            writer = JSONLinesWriter(fh)
+            self.assertEqual(writer.write_all(self.outputs), 2)
+            results = self._read(fh)
+        self.assertEqual(results[0]['host'], 'host1')
+        self.assertEqual(results[0]['exit_code'], 0)
+        self.assertEqual(results[0]['stdout'], ['a', 'b'])
+        self.assertEqual(results[0]['stderr'], [])
+        self.assertEqual(results[0]['exception'], None)
+        self.assertEqual(results[0]['timing']['command'], 2)
+        self.assertEqual(results[1]['exception'],
+                         {'type': 'ValueError', 'message': 'bad host'})
+        self.assertEqual(results[1]['stdout'], None)
+
+    def test_write_pssh_exception(self):
+        exceptions = [
+            ConnectionErrorException(
+                "Error connecting to host '%s:%s' - %s - retry %s/%s",
+                'host1', 22, 'Connection refused', 3, 3),
+            SSHException("General SSH error - bad", 'host2', 22)]
+        outputs = [HostOutput(ex.args[1], None, None, None, None, None,
+                              exception=ex) for ex in exceptions]
+        with tempfile.TemporaryFile('w+') as fh:
+            JSONLinesWriter(fh).write_all(outputs)
+            results = self._read(fh)
+        self.assertEqual(results[0]['exception'], {
+            'type': 'ConnectionErrorException',
+            'message': "Error connecting to host 'host1:22' - "
+                       "Connection refused - retry 3/3"})
+        self.assertEqual(results[1]['exception']['message'],
+                         "General SSH error - bad")
+
+    def test_write_digest_to_fd(self):
+        with tempfile.TemporaryFile('w+') as fh:
+            writer = JSONLinesWriter(fh.fileno(), output='digest')
+            writer.write(self.outputs[0])
+            result = self._read(fh)[0]
+        self.assertFalse('stdout' in result)
+        self.assertEqual(result['stdout_digest']['lines'], 2)
+        self.assertEqual(result['stdout_digest']['bytes'], 4)
+        self.assertEqual(result['stderr_digest']['lines'], 0)
+        self.assertRaises(ValueError, JSONLinesWriter, None, output='bad')
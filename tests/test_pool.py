@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+# This file is part of parallel-ssh.
+
+# Copyright (C) 2015- Panos Kittenis
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation, version 2.1.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+
+"""Unittests for :mod:`pssh.pool.Pool` class"""
+
+
+import unittest
+import time
+
+import gevent
+from pssh.pool import Pool, AdaptivePool
+
+
+class TestPool(unittest.TestCase):
+
+    def test_sleep_releases_slot(self):
+        pool = Pool(size=1)
+        sleeper = pool.spawn(pool.sleep, 1)
+        gevent.sleep(0)
+        self.assertEqual(pool.num_idle, 1)
+        worker = pool.spawn(lambda: 'done')
+        self.assertEqual(worker.get(timeout=0.5), 'done')
+        self.assertFalse(sleeper.ready())
+        sleeper.get(timeout=2)
+        self.assertEqual(pool.num_idle, 0)
+        self.assertEqual(pool.free_count(), 1)
+
+    def test_killed_while_resuming(self):
+        pool = Pool(size=1)
+        sleeper = pool.spawn(pool.sleep, 0.05)
+        gevent.sleep(0)
+        self.assertEqual(pool.free_count(), 1)
+        worker = pool.spawn(gevent.sleep, 0.2)
+        gevent.sleep(0.1)
+        # Sleeper is waiting for worker's slot to resume
+        self.assertEqual(pool.queue_depth, 1)
+        self.assertEqual(pool.free_count(), 0)
+        sleeper.kill()
+        worker.join()
+        self.assertEqual(pool.free_count(), 1)
+        # Slot released only once
+        self.assertEqual(pool._semaphore.counter, 1)
+
+    def test_queue_depth(self):
+        pool = Pool(size=1)
+        pool.spawn(gevent.sleep, 0.2)
+        spawners = [gevent.spawn(pool.spawn, gevent.sleep, 0)
+                    for _ in range(3)]
+        gevent.sleep(0)
+        self.assertEqual(pool.queue_depth, 3)
+        gevent.joinall(spawners)
+        pool.join()
+        self.assertEqual(pool.queue_depth, 0)
+
+    def test_idle_outside_pool(self):
+        pool = Pool(size=1)
+        with pool.idle():
+            pass
+        self.assertEqual(pool.free_count(), 1)
+
+    def test_resize(self):
+        pool = Pool(size=2)
+        blockers = [pool.spawn(gevent.sleep, 0.2) for _ in range(2)]
+        pool.resize(1)
+        self.assertEqual(pool.size, 1)
+        gevent.joinall(blockers)
+        workers = [pool.spawn(gevent.sleep, 0.1) for _ in range(2)]
+        # Second spawn waits for first worker to finish
+        self.assertTrue(workers[0].ready())
+        pool.join()
+        pool.resize(3)
+        for _ in range(3):
+            pool.spawn(gevent.sleep, 0.1)
+        self.assertEqual(len(pool), 3)
+        pool.join()
+        self.assertRaises(ValueError, Pool().resize, 1)
+
+
+class TestAdaptivePool(unittest.TestCase):
+
+    def test_increase(self):
+        pool = AdaptivePool(size=2, max_size=3)
+        for _ in range(2):
+            pool.record_connect(0.1)
+        self.assertEqual(pool.size, 3)
+        for _ in range(10):
+            pool.record_connect(0.1)
+        self.assertEqual(pool.size, 3)
+
+    def test_decrease_on_error(self):
+        pool = AdaptivePool(size=8, max_size=8, cooldown=10, error_window=8)
+        pool.record_error(Exception())
+        # Too few attempts to calculate error rate
+        self.assertEqual(pool.error_rate, None)
+        self.assertEqual(pool.size, 8)
+        pool.record_error(Exception())
+        self.assertEqual(pool.size, 4)
+        # Within cooldown
+        for _ in range(4):
+            pool.record_error(Exception())
+        self.assertEqual(pool.size, 4)
+
+    def test_occasional_errors(self):
+        pool = AdaptivePool(size=8, max_size=8, cooldown=0)
+        # One in twenty hosts down
+        for i in range(200):
+            if i % 20:
+                pool.record_connect(0.1)
+            else:
+                pool.record_error(Exception())
+        self.assertEqual(pool.size, 8)
+        self.assertEqual(pool.error_rate, 0.05)
+
+    def test_decrease_on_latency(self):
+        pool = AdaptivePool(size=8, cooldown=0)
+        pool.record_connect(0.1)
+        for _ in range(5):
+            pool.record_connect(1)
+        self.assertEqual(pool.size, 1)
+
+    def test_mixed_latency(self):
+        pool = AdaptivePool(size=8, max_size=8, cooldown=0)
+        for i in range(200):
+            pool.record_connect(0.1 if i % 2 else 0.5)
+        # Baseline rises to latency of mixed hosts and pool grows back
+        self.assertTrue(pool.baseline_latency > 0.2)
+        self.assertEqual(pool.size, 8)
+
+    def test_decrease_on_loop_lag(self):
+        pool = AdaptivePool(size=8, max_loop_lag=0.05, cooldown=10,
+                            loop_lag_interval=0.01)
+        pool.spawn(gevent.sleep, 0.2)
+        gevent.sleep(0)
+        # Block event loop
+        start = time.time()
+        while time.time() - start < 0.1:
+            pass
+        gevent.sleep(0.05)
+        self.assertEqual(pool.size, 4)
+        pool.join()
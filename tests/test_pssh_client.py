@@ -27,18 +27,25 @@ import logging
 import os
 import warnings
 import shutil
+import tempfile
 import sys
+import time
 from socket import timeout as socket_timeout
 
 from gevent import sleep
 from pssh import ParallelSSHClient, UnknownHostException, \
      AuthenticationException, ConnectionErrorException, SSHException, \
      logger as pssh_logger
-from pssh.exceptions import HostArgumentException
-from pssh.utils import load_private_key
+from pssh.exceptions import HostArgumentException, Timeout
+from pssh.utils import load_private_key, iter_lines, clear_config_cache
 from embedded_server.embedded_server import start_server, make_socket, \
      logger as server_logger, paramiko_logger, start_server_from_ip
 from pssh.agent import SSHAgent
+from pssh.pool import AdaptivePool
+from pssh.circuit import CircuitBreaker
+from pssh.resolver import Resolver
+from pssh.hooks import MetricsHooks
+from pssh.output import Retention
 from paramiko import RSAKey
 
 PKEY_FILENAME = os.path.sep.join([os.path.dirname(__file__), 'test_client_private_key'])
@@ -117,6 +124,105 @@ class ParallelSSHClientTest(unittest.TestCase):
                          (stderr,
                           expected_stderr,))
 
+    def test_client_join_timeout(self):
+        output = self.client.run_command('sleep 2')
+        self.assertRaises(Timeout, self.client.join, output, timeout=.5)
+        self.assertEqual(output[self.host].exit_code, None)
+        self.client.join(output)
+        self.assertEqual(output[self.host].exit_code, 0)
+
+    def test_client_join_timeout_read_output(self):
+        output = self.client.run_command('echo me; sleep .5; echo you')
+        self.assertRaises(Timeout, self.client.join, output, timeout=.2)
+        self.assertEqual(list(output[self.host].stdout), ['me', 'you'])
+        self.assertEqual(output[self.host].exit_code, 0)
+        # Output consumed in join is not cut short by timeout
+        stdout = []
+        output = self.client.run_command(
+            'echo me; sleep .5; echo you',
+            on_stdout=lambda host, line: stdout.append(line))
+        self.assertRaises(Timeout, self.client.join, output,
+                          consume_output=True, timeout=.2)
+        self.client.join(output, consume_output=True)
+        self.assertEqual(stdout, ['me', 'you'])
+
+    def test_client_join_concurrent(self):
+        host2 = '127.0.0.2'
+        server2, _ = start_server_from_ip(host2, port=self.listen_port)
+        hosts = [self.host, host2]
+        client = ParallelSSHClient(hosts, port=self.listen_port,
+                                   pkey=self.user_key)
+        try:
+            output = client.run_command('sleep 1; echo me')
+            start = time.time()
+            client.join(output, consume_output=True, timeout=5)
+            self.assertTrue(time.time() - start < 2)
+            for host in hosts:
+                self.assertEqual(output[host].exit_code, 0)
+        finally:
+            del client
+            server2.kill()
+
+    def test_as_completed(self):
+        host2 = '127.0.0.2'
+        server2, _ = start_server_from_ip(host2, port=self.listen_port)
+        hosts = [self.host, host2]
+        client = ParallelSSHClient(hosts, port=self.listen_port,
+                                   pkey=self.user_key)
+        try:
+            output = client.run_command(
+                '%s', host_args=('sleep 1; exit 2', 'exit 1'))
+            completed = [(host_out.host, host_out.exit_code)
+                         for host_out in client.as_completed(output)]
+            self.assertEqual([(host2, 1), (self.host, 2)], completed)
+            output = client.run_command('sleep 2')
+            self.assertRaises(Timeout, list,
+                              client.as_completed(output, timeout=.5))
+        finally:
+            del client
+            server2.kill()
+
+    def test_as_completed_connection_error(self):
+        # No server listening on second host
+        hosts = [self.host, '127.0.0.3']
+        self.client.hosts = hosts
+        self.client.num_retries = 1
+        output = self.client.run_command('sleep 1; exit 2',
+                                         stop_on_errors=False)
+        completed = [(host_out.host, host_out.exit_code)
+                     for host_out in self.client.as_completed(output)]
+        self.assertEqual([(hosts[1], None), (hosts[0], 2)], completed)
+        self.assertTrue(isinstance(output[hosts[1]].exception,
+                                   ConnectionErrorException))
+
+    def test_as_completed_timeout(self):
+        output = self.client.run_command('sleep 2')
+        self.assertRaises(Timeout, list,
+                          self.client.as_completed(output, timeout=.5))
+        self.assertEqual([0], [host_out.exit_code for host_out
+                               in self.client.as_completed(output)])
+
+    def test_exit_code_recorded_on_exit(self):
+        output = self.client.run_command('exit 3')
+        output[self.host].channel.status_event.wait()
+        sleep(.1)
+        self.assertTrue(self.client.finished(output))
+        self.assertEqual(3, output[self.host].exit_code)
+
+    def test_exit_code_recorded_before_output_read(self):
+        output = self.client.run_command('seq 1 1000')
+        channel = output[self.host].channel
+        closed = []
+        channel.close = lambda: closed.append(True)
+        channel.status_event.wait()
+        sleep(.1)
+        self.assertEqual(0, output[self.host].exit_code)
+        self.assertEqual([], closed)
+        stdout = list(output[self.host].stdout)
+        self.assertEqual([str(i) for i in range(1, 1001)], stdout)
+        list(output[self.host].stderr)
+        self.assertEqual([True], closed)
+
     def test_pssh_client_no_stdout_non_zero_exit_code_immediate_exit(self):
         output = self.client.run_command('exit 1')
         expected_exit_code = 1
@@ -289,6 +395,421 @@ class ParallelSSHClientTest(unittest.TestCase):
                         msg="Got non-zero exit code %s" % (
                             output[self.host]['exit_code'],))
 
+    def test_raw_output(self):
+        output = self.client.run_command('echo "  me"; echo err >&2',
+                                         raw_output=True, use_pty=False)
+        stdout = b''.join(output[self.host].stdout)
+        stderr = b''.join(output[self.host].stderr)
+        self.assertEqual(stdout, b'  me\n')
+        self.assertEqual(stderr, b'err\n')
+        self.client.join(output)
+        self.assertEqual(output[self.host].exit_code, 0)
+        output = self.client.run_command('seq 1 10000', raw_output=True)
+        lines = list(iter_lines(output[self.host].stdout))
+        self.assertEqual(lines, [str(i).encode('ascii')
+                                 for i in range(1, 10001)])
+
+    def test_retention(self):
+        output = self.client.run_command('seq 1 1000',
+                                         retention=Retention(lines=2))
+        self.client.join(output)
+        self.assertEqual(output[self.host].exit_code, 0)
+        self.assertEqual(list(output[self.host].stdout), ['999', '1000'])
+        self.assertEqual(output[self.host].stdout.num_lines, 1000)
+        output = self.client.run_command(
+            'seq 1 1000', retention=Retention(lines=2, keep='head'))
+        self.assertEqual(list(output[self.host].stdout), ['1', '2'])
+        self.assertEqual(list(output[self.host].stderr), [])
+        self.client.join(output)
+        self.assertEqual(output[self.host].exit_code, 0)
+
+    def test_spool_dir(self):
+        spool_dir = tempfile.mkdtemp()
+        try:
+            output = self.client.run_command(
+                'echo "  me"; echo err >&2; seq 1 1000', spool_dir=spool_dir,
+                use_pty=False)
+            self.client.join(output)
+            self.assertEqual(output[self.host].exit_code, 0)
+            stdout = output[self.host].stdout
+            self.assertEqual(stdout.path, os.path.join(
+                spool_dir, '%s.stdout' % (self.host,)))
+            lines = list(stdout)
+            self.assertEqual(lines[0], '  me')
+            self.assertEqual(lines[-1], '1000')
+            self.assertEqual(len(lines), 1001)
+            view = stdout.view()
+            self.assertEqual(view[:5].tobytes(), b'  me\n')
+            self.assertEqual(len(view), stdout.num_bytes)
+            view.release()
+            self.assertEqual(list(output[self.host].stderr), ['err'])
+            self.assertRaises(ValueError, self.client.run_command,
+                              self.fake_cmd, spool_dir=spool_dir,
+                              retention=Retention(lines=1))
+        finally:
+            shutil.rmtree(spool_dir)
+
+    def test_group_output(self):
+        host2 = '127.0.0.2'
+        server2, _ = start_server_from_ip(host2, port=self.listen_port)
+        hosts = [self.host, host2]
+        client = ParallelSSHClient(hosts, port=self.listen_port,
+                                   pkey=self.user_key)
+        try:
+            output = client.run_command(self.fake_cmd)
+            groups = client.group_output(output)
+            self.assertEqual(len(groups), 1)
+            self.assertEqual(sorted(groups[0].hosts), hosts)
+            self.assertEqual(groups[0].stdout, [self.fake_resp])
+            output = client.run_command('echo %s', host_args=('a', 'b'))
+            groups = client.group_output(output)
+            self.assertEqual(len(groups), 2)
+            self.assertEqual(sorted(group.stdout for group in groups),
+                             [['a'], ['b']])
+        finally:
+            del client
+            server2.kill()
+
+    def test_pump_output(self):
+        client = ParallelSSHClient([self.host], port=self.listen_port,
+                                   pkey=self.user_key, pump_output=True)
+        # More output than fits in channel window
+        output = client.run_command('seq 1 100000', use_pty=False)
+        client.join(output, timeout=30)
+        self.assertEqual(output[self.host].exit_code, 0)
+        stdout = output[self.host].stdout
+        lines = list(stdout)
+        self.assertTrue(stdout.done)
+        self.assertEqual(len(lines), 100000)
+        self.assertEqual(lines[-1], '100000')
+        del client
+
+    def test_output_callbacks(self):
+        stdout, stderr = [], []
+        output = self.client.run_command(
+            'echo me; echo err >&2', use_pty=False,
+            on_stdout=lambda host, line: stdout.append((host, line)),
+            on_stderr=lambda host, line: stderr.append((host, line)))
+        self.client.join(output, consume_output=True)
+        self.assertEqual(stdout, [(self.host, 'me')])
+        self.assertEqual(stderr, [(self.host, 'err')])
+        chunks = []
+        output = self.client.run_command(
+            'echo me', raw_output=True,
+            on_stdout=lambda host, chunk: chunks.append(chunk))
+        self.assertEqual(b''.join(output[self.host].stdout), b''.join(chunks))
+        self.assertEqual(b''.join(chunks).strip(), b'me')
+
+    def test_timing(self):
+        output = self.client.run_command(self.fake_cmd)
+        self.client.join(output)
+        stdout = list(output[self.host].stdout)
+        timing = output[self.host].timing
+        durations = timing.durations()
+        for phase in ('dns', 'connect', 'auth', 'channel_open', 'exec',
+                      'first_byte', 'command'):
+            self.assertTrue(durations[phase] is not None,
+                            msg="No duration for phase %s" % (phase,))
+        summary = self.client.timing_summary(output)
+        self.assertEqual(summary['connect']['count'], 1)
+        # Connection is reused by second command
+        output = self.client.run_command(self.fake_cmd)
+        self.client.join(output)
+        durations = output[self.host].timing.durations()
+        self.assertEqual(durations['connect'], None)
+        self.assertTrue(durations['command'] is not None)
+
+    def test_timing_first_byte(self):
+        output = self.client.run_command('echo me; sleep .5')
+        self.assertEqual(list(output[self.host].stdout), ['me'])
+        durations = output[self.host].timing.durations()
+        self.assertTrue(durations['first_byte'] < .5)
+        self.assertTrue(durations['command'] >= .5)
+        # Output read in background is read as soon as it arrives
+        output = self.client.run_command('echo me; sleep .5',
+                                         retention=Retention())
+        self.client.join(output)
+        self.assertEqual(list(output[self.host].stdout), ['me'])
+        durations = output[self.host].timing.durations()
+        self.assertTrue(durations['first_byte'] < .5,
+                        msg="First byte recorded when output was iterated on")
+        self.assertTrue(durations['command'] >= .5)
+
+    def test_connect(self):
+        bad_host = '127.0.0.2'
+        client = ParallelSSHClient([self.host, bad_host],
+                                   port=self.listen_port,
+                                   pkey=self.user_key, num_retries=1)
+        results = client.connect()
+        self.assertTrue(results[self.host].connected)
+        self.assertTrue(results[self.host].timing.durations()['auth']
+                        is not None)
+        self.assertFalse(results[bad_host].connected)
+        self.assertTrue(isinstance(results[bad_host].exception,
+                                   ConnectionErrorException))
+        # Already connected
+        results = client.connect()
+        self.assertTrue(results[self.host].connected)
+        self.assertEqual(results[self.host].timing, None)
+        client.hosts = [self.host]
+        output = client.run_command(self.fake_cmd)
+        client.join(output)
+        self.assertEqual(list(output[self.host].stdout), [self.fake_resp])
+        durations = output[self.host].timing.durations()
+        self.assertEqual(durations['connect'], None)
+        self.assertTrue(durations['channel_open'] is not None)
+        del client
+
+    def test_max_connections(self):
+        host2 = '127.0.0.2'
+        server2, _ = start_server_from_ip(host2, port=self.listen_port)
+        client = ParallelSSHClient([self.host], port=self.listen_port,
+                                   pkey=self.user_key, max_connections=1)
+        output = client.run_command(self.fake_cmd)
+        client.join(output)
+        host_client = client.host_clients[self.host]
+        client.hosts = [host2]
+        output = client.run_command(self.fake_cmd)
+        client.join(output)
+        self.assertEqual(list(output[host2].stdout), [self.fake_resp])
+        self.assertEqual(list(client.host_clients), [host2])
+        self.assertEqual(client.num_evictions, 1)
+        self.assertFalse(host_client.client.get_transport())
+        # Server accepts one connection per listen greenlet
+        server = start_server(self.server_sock)
+        client.hosts = [self.host]
+        output = client.run_command(self.fake_cmd)
+        client.join(output)
+        self.assertEqual(list(output[self.host].stdout), [self.fake_resp])
+        self.assertEqual(client.num_reconnects, 1)
+        self.assertEqual(client.num_evictions, 2)
+        server2.kill()
+        server.kill()
+        del client
+
+    def test_least_recently_used_order(self):
+        client = ParallelSSHClient(['a', 'b', 'c'])
+        for host in client.hosts:
+            client.host_clients[host] = object()
+            client._touch(host)
+        for _ in range(50):
+            client._touch('a')
+        client._touch('b')
+        self.assertEqual(list(client._lru_hosts()), ['c', 'a', 'b'])
+        self.assertTrue(len(client._lru) < 50)
+        del client.host_clients['a'], client._last_used['a']
+        self.assertEqual(list(client._lru_hosts()), ['c', 'b'])
+
+    def test_max_connections_fewer_than_hosts(self):
+        hosts = [self.host, '127.0.0.2', '127.0.0.3', '127.0.0.4']
+        servers = [start_server_from_ip(host, port=self.listen_port)[0]
+                   for host in hosts[1:]]
+        client = ParallelSSHClient(hosts, port=self.listen_port,
+                                   pkey=self.user_key, pool_size=1,
+                                   max_connections=1)
+        try:
+            output = client.run_command('exit 0')
+            client.join(output)
+            self.assertEqual(sorted(output), sorted(hosts))
+            for host in hosts:
+                self.assertEqual(output[host].exit_code, 0)
+            self.assertTrue(client.num_evictions > 0)
+        finally:
+            for server in servers:
+                server.kill()
+        del client
+
+    def test_idle_timeout(self):
+        client = ParallelSSHClient([self.host], port=self.listen_port,
+                                   pkey=self.user_key, idle_timeout=.2)
+        output = client.run_command(self.fake_cmd)
+        # Open channel keeps connection from being closed
+        self.assertEqual(client.evict_idle(0), 0)
+        client.join(output)
+        self.assertEqual(list(output[self.host].stdout), [self.fake_resp])
+        self.assertEqual(client.evict_idle(), 0)
+        sleep(.5)
+        self.assertEqual(len(client.host_clients), 0)
+        self.assertEqual(client.num_evictions, 1)
+        del client
+
+    def test_idle_timeout_after_long_command(self):
+        client = ParallelSSHClient([self.host], port=self.listen_port,
+                                   pkey=self.user_key)
+        output = client.run_command('sleep .5')
+        client.join(output)
+        # Connection counts as used when command finished, not started
+        self.assertEqual(client.evict_idle(.3), 0)
+        self.assertEqual(len(client.host_clients), 1)
+        del client
+
+    def test_dead_connection_reconnect(self):
+        client = ParallelSSHClient([self.host], port=self.listen_port,
+                                   pkey=self.user_key, keepalive_seconds=60)
+        output = client.run_command(self.fake_cmd)
+        client.join(output)
+        self.assertTrue(client.host_clients[self.host].is_alive)
+        client.host_clients[self.host].client.get_transport().close()
+        self.assertFalse(client.host_clients[self.host].is_alive)
+        # Server accepts one connection per listen greenlet
+        server = start_server(self.server_sock)
+        output = client.run_command(self.fake_cmd)
+        client.join(output)
+        self.assertEqual(list(output[self.host].stdout), [self.fake_resp])
+        self.assertEqual(client.num_dead_connections, 1)
+        self.assertEqual(client.num_reconnects, 1)
+        self.assertTrue(client.host_clients[self.host].is_alive)
+        # Connection dies when opening channel
+        host_client = client.host_clients[self.host]
+
+        def _dead_exec_command(*args, **kwargs):
+            host_client.client.get_transport().close()
+            raise EOFError()
+        host_client.exec_command = _dead_exec_command
+        server2 = start_server(self.server_sock)
+        output = client.run_command(self.fake_cmd)
+        client.join(output)
+        self.assertEqual(list(output[self.host].stdout), [self.fake_resp])
+        self.assertEqual(client.num_dead_connections, 2)
+        self.assertFalse(client.host_clients[self.host] is host_client)
+        server.kill()
+        server2.kill()
+        del client
+
+    def test_circuit_breaker(self):
+        # Port with no server listening on it on separate ip
+        host = '127.0.0.3'
+        port = self.make_random_port(host=host)
+        breaker = CircuitBreaker(threshold=2, cooldown=60)
+        client = ParallelSSHClient([host], port=port, num_retries=1,
+                                   circuit_breaker=breaker)
+        for _ in range(2):
+            output = client.run_command(self.fake_cmd, stop_on_errors=False)
+            self.assertIsInstance(output[host].exception,
+                                  ConnectionErrorException)
+        self.assertEqual(breaker.state(host), CircuitBreaker.OPEN)
+        output = client.run_command(self.fake_cmd, stop_on_errors=False)
+        self.assertIsInstance(output[host].exception, ConnectionErrorException)
+        self.assertTrue('circuit open' in output[host].exception.args[0])
+        self.assertEqual(breaker.failures(host), 2)
+        # Probe after cooldown fails and re-opens circuit
+        breaker.cooldown = 0
+        output = client.run_command(self.fake_cmd, stop_on_errors=False)
+        self.assertFalse('circuit open' in output[host].exception.args[0])
+        self.assertEqual(breaker.failures(host), 3)
+        # Successful connection closes circuit
+        breaker.record_failure(self.host)
+        client = ParallelSSHClient([self.host], port=self.listen_port,
+                                   pkey=self.user_key, circuit_breaker=breaker)
+        output = client.run_command(self.fake_cmd)
+        client.join(output)
+        self.assertEqual(list(output[self.host].stdout), [self.fake_resp])
+        self.assertEqual(breaker.state(self.host), CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.failures(self.host), 0)
+        del client
+
+    def test_resolver(self):
+        resolver = Resolver()
+        host = 'an.invalid'
+        client = ParallelSSHClient([self.host, host], port=self.listen_port,
+                                   pkey=self.user_key, resolver=resolver)
+        start = time.time()
+        output = client.run_command(self.fake_cmd, stop_on_errors=False)
+        client.join(output)
+        # Resolution errors are not retried
+        self.assertTrue(time.time() - start < 1)
+        self.assertIsInstance(output[host].exception, UnknownHostException)
+        self.assertEqual(list(output[self.host].stdout), [self.fake_resp])
+        self.assertEqual(resolver.num_lookups, 2)
+        del client
+
+    def test_resolver_host_generator(self):
+        resolver = Resolver()
+        client = ParallelSSHClient((host for host in [self.host]),
+                                   port=self.listen_port, pkey=self.user_key,
+                                   resolver=resolver)
+        output = client.run_command(self.fake_cmd)
+        client.join(output)
+        self.assertEqual(list(output), [self.host])
+        self.assertEqual(list(output[self.host].stdout), [self.fake_resp])
+        self.assertEqual(resolver.num_lookups, 1)
+        del client
+
+    def test_resolver_openssh_config_alias(self):
+        home = tempfile.mkdtemp()
+        os.mkdir(os.path.join(home, '.ssh'))
+        with open(os.path.join(home, '.ssh', 'config'), 'w') as fh:
+            fh.write("Host myalias\n  HostName %s\n" % (self.host,))
+        _home = os.environ.get('HOME')
+        os.environ['HOME'] = home
+        resolver = Resolver()
+        client = ParallelSSHClient(['myalias'], port=self.listen_port,
+                                   pkey=self.user_key, resolver=resolver)
+        try:
+            output = client.run_command(self.fake_cmd)
+            client.join(output)
+            self.assertEqual(list(output['myalias'].stdout), [self.fake_resp])
+            # Host address from config is resolved rather than alias
+            self.assertEqual(list(resolver._cache), [self.host])
+            self.assertEqual(resolver.num_lookups, 1)
+        finally:
+            del client
+            os.environ['HOME'] = _home
+            shutil.rmtree(home)
+            clear_config_cache()
+
+    def test_metrics_hooks(self):
+        metrics = MetricsHooks()
+        client = ParallelSSHClient([self.host], port=self.listen_port,
+                                   pkey=self.user_key, hooks=metrics)
+        output = client.run_command(self.fake_cmd)
+        client.join(output)
+        stdout = list(output[self.host].stdout)
+        self.assertEqual(stdout, [self.fake_resp])
+        counters = metrics.counters
+        self.assertEqual(counters[('pssh_connects_total',
+                                   (('result', 'success'),))], 1)
+        self.assertEqual(counters[('pssh_auth_total',
+                                   (('result', 'success'),))], 1)
+        self.assertEqual(counters[('pssh_command_exits_total',
+                                   (('exit_code', 0),))], 1)
+        self.assertTrue(counters[('pssh_read_bytes_total',
+                                  (('stream', 'stdout'),))] > 0)
+        local_filename = 'test_file_hooks'
+        remote_filename = 'test_file_hooks_copy'
+        with open(local_filename, 'w') as fh:
+            fh.write('test')
+        try:
+            client.copy_file(local_filename, remote_filename)[0].get()
+        finally:
+            for filepath in [local_filename, remote_filename]:
+                if os.path.isfile(filepath):
+                    os.unlink(filepath)
+        self.assertEqual(counters[('pssh_transferred_bytes_total',
+                                   (('direction', 'upload'),))], 4)
+        del client
+
+    def test_adaptive_pool_size(self):
+        client = ParallelSSHClient([self.host], port=self.listen_port,
+                                   pkey=self.user_key, pool_size=1,
+                                   max_pool_size=5)
+        self.assertTrue(isinstance(client.pool, AdaptivePool))
+        output = client.run_command(self.fake_cmd)
+        client.join(output)
+        self.assertEqual(output[self.host].exit_code, 0)
+        self.assertEqual(client.pool.size, 2)
+        self.assertTrue(client.pool.latency is not None)
+        dead_client = ParallelSSHClient(['127.0.0.3'], port=self.listen_port,
+                                        pool_size=4, max_pool_size=5,
+                                        num_retries=1)
+        self.assertRaises(ConnectionErrorException, dead_client.run_command,
+                          self.fake_cmd)
+        # Single error is not enough to decrease size
+        self.assertEqual(dead_client.pool.size, 4)
+        for _ in range(4):
+            dead_client.run_command(self.fake_cmd, stop_on_errors=False)
+        self.assertEqual(dead_client.pool.size, 2)
+
     def test_pssh_client_retries(self):
         """Test connection error retries"""
         listen_port = self.make_random_port()
@@ -591,6 +1112,10 @@ class ParallelSSHClientTest(unittest.TestCase):
                              msg="Got unexpected stdout - %s, expected %s" % 
                              (stdout,
                               expected_stdout,))
+            self.assertEqual(client.num_proxy_connections, 1)
+            proxy_client = client.host_clients[self.host].proxy_client
+            self.assertEqual(client._get_shared_proxy_client(), proxy_client)
+            self.assertEqual(client.num_proxy_connections, 1)
         finally:
             del client
             server.kill()
@@ -614,6 +1139,24 @@ class ParallelSSHClientTest(unittest.TestCase):
             del client
             proxy_server.kill()
 
+    def test_ssh_proxy_unreachable_output_keys(self):
+        proxy_host = '127.0.0.9'
+        hosts = [self.host, '127.0.0.2']
+        client = ParallelSSHClient(hosts, port=self.listen_port,
+                                   pkey=self.user_key,
+                                   proxy_host=proxy_host,
+                                   proxy_port=self.make_random_port(
+                                       host=proxy_host),
+                                   num_retries=1)
+        output = client.run_command(self.fake_cmd, stop_on_errors=False)
+        self.assertEqual(sorted(output), sorted(hosts))
+        for host in hosts:
+            ex = output[host].exception
+            self.assertTrue(isinstance(ex, ConnectionErrorException))
+            self.assertEqual(ex.args[1], host)
+            self.assertTrue(proxy_host in ex.args[3])
+        del client
+
     def test_ssh_proxy_auth(self):
         """Test connecting to remote destination via SSH proxy
         client -> proxy -> destination
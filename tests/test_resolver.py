@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+# This file is part of parallel-ssh.
+
+# Copyright (C) 2015- Panos Kittenis
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation, version 2.1.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+"""Unittests for :mod:`pssh.resolver.Resolver` class"""
+
+
+import unittest
+from socket import gaierror
+
+from pssh.resolver import Resolver
+
+
+class TestResolver(unittest.TestCase):
+
+    def test_resolve(self):
+        resolver = Resolver()
+        addresses = resolver.resolve('127.0.0.1', 2222)
+        self.assertTrue(len(addresses) > 0)
+        for address in addresses:
+            self.assertEqual(address[-1][:2], ('127.0.0.1', 2222))
+        # Cached addresses get port of each call
+        addresses = resolver.resolve('127.0.0.1', 22)
+        self.assertEqual(addresses[0][-1][:2], ('127.0.0.1', 22))
+        self.assertEqual(resolver.num_lookups, 1)
+
+    def test_ttl(self):
+        resolver = Resolver(ttl=0)
+        resolver.resolve('127.0.0.1', 22)
+        resolver.resolve('127.0.0.1', 22)
+        self.assertEqual(resolver.num_lookups, 2)
+
+    def test_resolution_error_cached(self):
+        resolver = Resolver()
+        host = 'an.invalid'
+        self.assertRaises(gaierror, resolver.resolve, host, 22)
+        self.assertRaises(gaierror, resolver.resolve, host, 22)
+        self.assertEqual(resolver.num_lookups, 1)
+        resolver.clear(host)
+        self.assertRaises(gaierror, resolver.resolve, host, 22)
+        self.assertEqual(resolver.num_lookups, 2)
+
+    def test_resolve_all(self):
+        resolver = Resolver(pool_size=2)
+        hosts = ['127.0.0.1', '127.0.0.2', '127.0.0.3', 'an.invalid',
+                 '127.0.0.1']
+        results = resolver.resolve_all(hosts)
+        self.assertEqual(set(results), set(hosts))
+        self.assertIsInstance(results['an.invalid'], gaierror)
+        self.assertEqual(results['127.0.0.2'][0][-1][0], '127.0.0.2')
+        self.assertEqual(resolver.num_lookups, 4)
+        resolver.resolve('127.0.0.3', 22)
+        self.assertEqual(resolver.num_lookups, 4)
+        resolver.clear()
+        resolver.resolve('127.0.0.3', 22)
+        self.assertEqual(resolver.num_lookups, 5)
+
+    def test_prune_expired(self):
+        resolver = Resolver(ttl=0, negative_ttl=0)
+        resolver.resolve_all(['127.0.0.1', '127.0.0.2', 'an.invalid'])
+        self.assertEqual(len(resolver._cache), 3)
+        resolver.resolve('127.0.0.3', 22)
+        self.assertEqual(list(resolver._cache), ['127.0.0.3'])
+
+    def test_invalid_args(self):
+        self.assertRaises(ValueError, Resolver, ttl=-1)
+        self.assertRaises(ValueError, Resolver, negative_ttl=-1)
+        self.assertRaises(ValueError, Resolver, pool_size=0)
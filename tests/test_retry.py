@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+# This file is part of parallel-ssh.
+
+# Copyright (C) 2015- Panos Kittenis
+
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation, version 2.1.
+
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301  USA
+
+
+
+"""Unittests for :mod:`pssh.retry.RetryPolicy` class"""
+
+
+import unittest
+from pssh.retry import RetryPolicy
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_exponential_delay(self):
+        policy = RetryPolicy(delay=1, multiplier=2, max_delay=5, jitter=0)
+        self.assertEqual([policy.get_delay(retries)
+                          for retries in range(1, 6)],
+                         [1, 2, 4, 5, 5])
+
+    def test_jitter(self):
+        policy = RetryPolicy(delay=4, multiplier=1, jitter=0.5)
+        for _ in range(100):
+            delay = policy.get_delay(1)
+            self.assertTrue(2 <= delay <= 4)
+        self.assertRaises(ValueError, RetryPolicy, jitter=2)
+
+    def test_timeout(self):
+        policy = RetryPolicy(delay=4, jitter=0, timeout=10)
+        self.assertEqual(policy.get_delay(1, elapsed=1), 4)
+        self.assertEqual(policy.get_delay(1, elapsed=8), 2)
+        self.assertEqual(policy.get_delay(1, elapsed=10), None)
@@ -31,6 +31,7 @@ from pssh import SSHClient, ParallelSSHClient, UnknownHostException, Authenticat
 from embedded_server.embedded_server import start_server, make_socket, logger as server_logger, \
      paramiko_logger
 from pssh.agent import SSHAgent
+from pssh.retry import RetryPolicy
 import paramiko
 import os
 import random, string
@@ -286,6 +287,14 @@ not match source %s" % (copied_file_data, test_file_data))
         self.assertRaises(UnknownHostException, SSHClient, host, port=self.listen_port,
                           pkey=self.user_key, num_retries=1)
 
+    def test_ssh_client_retry_policy(self):
+        retry_policy = RetryPolicy(delay=0.1, jitter=0, timeout=0.5)
+        start = time.time()
+        self.assertRaises(ConnectionErrorException, SSHClient, '127.0.0.100',
+                          port=self.listen_port, pkey=self.user_key,
+                          num_retries=100, retry_policy=retry_policy)
+        self.assertTrue(time.time() - start < 5)
+
     def test_ssh_client_unknown_host_failure(self):
         """Test connection error failure case - ConnectionErrorException"""
         host = ''.join([random.choice(string.ascii_letters) for n in xrange(8)])
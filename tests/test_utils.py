@@ -1,11 +1,12 @@
 from pssh import utils
 import unittest
 import os
+import logging
 from logging import NullHandler
 try:
-    from cStringIO import StringIO as BytesIO
+    from cStringIO import StringIO as BytesIO, StringIO
 except ImportError:
-    from io import BytesIO
+    from io import BytesIO, StringIO
 from uuid import uuid4
 
 PKEY_FILENAME = os.path.sep.join([os.path.dirname(__file__), 'test_client_private_key'])
@@ -23,6 +24,40 @@ class ParallelSSHUtilsTest(unittest.TestCase):
         self.assertTrue(len([h for h in utils.host_logger.handlers
                              if not isinstance(h, NullHandler)]) == 1)
 
+    def test_enabling_host_logger_handler(self):
+        stream = StringIO()
+        handler = utils.AsyncHostLogHandler(stream=stream)
+        handlers = list(utils.host_logger.handlers)
+        try:
+            utils.enable_host_logger()
+            utils.enable_host_logger(handler)
+            utils.enable_host_logger(handler)
+            # Handler replaces stream handler rather than being added to it
+            self.assertEqual([h for h in utils.host_logger.handlers
+                              if not isinstance(h, NullHandler)], [handler])
+            utils.enable_host_logger()
+            self.assertEqual([h for h in utils.host_logger.handlers
+                              if not isinstance(h, NullHandler)], [handler])
+        finally:
+            utils.host_logger.handlers = handlers
+            handler.close()
+
+    def test_enabling_host_logger_application_handler(self):
+        app_handler = logging.StreamHandler(StringIO())
+        handler = logging.StreamHandler(StringIO())
+        handlers = list(utils.host_logger.handlers)
+        utils.host_logger.handlers = [
+            h for h in handlers if isinstance(h, NullHandler)]
+        utils.host_logger.addHandler(app_handler)
+        try:
+            utils.enable_host_logger(handler)
+            # Handlers not enabled by pssh are not removed
+            self.assertEqual([h for h in utils.host_logger.handlers
+                              if not isinstance(h, NullHandler)],
+                             [app_handler, handler])
+        finally:
+            utils.host_logger.handlers = handlers
+
     def test_enabling_pssh_logger(self):
         self.assertTrue(len([h for h in utils.logger.handlers
                              if isinstance(h, NullHandler)]) == 1)
@@ -30,6 +65,31 @@ class ParallelSSHUtilsTest(unittest.TestCase):
         self.assertTrue(len([h for h in utils.host_logger.handlers
                              if not isinstance(h, NullHandler)]) == 1)
 
+    def test_async_host_log_handler(self):
+        stream = StringIO()
+        handler = utils.AsyncHostLogHandler(stream=stream, max_queue=5)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _logger = logging.getLogger(str(uuid4()))
+        _logger.propagate = False
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+        for i in range(10):
+            _logger.info("[%s]\t%s", 'host', i)
+        # No yield to writer - records past queue size are dropped
+        self.assertEqual(handler.dropped, 5)
+        handler.flush()
+        self.assertEqual(stream.getvalue(), ''.join(
+            ['[host]\t%s\n' % (i,) for i in range(5)]))
+        handler.policy = handler.BLOCK
+        for i in range(10):
+            _logger.info("%s", i)
+        handler.close()
+        self.assertEqual(handler.dropped, 5)
+        self.assertEqual(stream.getvalue().splitlines()[5:],
+                         [str(i) for i in range(10)])
+        self.assertRaises(ValueError, utils.AsyncHostLogHandler,
+                          policy='bad')
+
     def test_loading_key_files(self):
         for key_filename in [PKEY_FILENAME, DSA_KEY_FILENAME, ECDSA_KEY_FILENAME]:
             pkey = utils.load_private_key(key_filename)
@@ -41,3 +101,56 @@ class ParallelSSHUtilsTest(unittest.TestCase):
 
     def test_openssh_config_missing(self):
         self.assertFalse(utils.read_openssh_config('test', config_file=str(uuid4())))
+
+    def test_private_key_cache(self):
+        utils.clear_config_cache()
+        pkey = utils.load_private_key(PKEY_FILENAME)
+        self.assertTrue(utils.load_private_key(PKEY_FILENAME) is pkey)
+        utils.clear_config_cache()
+        self.assertFalse(utils.load_private_key(PKEY_FILENAME) is pkey)
+        self.assertEqual(utils.load_private_key(PKEY_FILENAME), pkey)
+
+    def test_openssh_config_cache(self):
+        utils.clear_config_cache()
+        config_file = os.path.sep.join([os.path.dirname(__file__),
+                                        str(uuid4())])
+        with open(config_file, 'w') as fh:
+            fh.write("Host test\n  HostName 127.0.0.1\n  Port 2222\n")
+        try:
+            self.assertEqual(
+                utils.read_openssh_config('test', config_file=config_file),
+                ('127.0.0.1', None, 2222, None))
+            with open(config_file, 'w') as fh:
+                fh.write("Host test\n  HostName 127.0.0.2\n  Port 2223\n")
+            utils.clear_config_cache()
+            self.assertEqual(
+                utils.read_openssh_config('test', config_file=config_file),
+                ('127.0.0.2', None, 2223, None))
+        finally:
+            os.unlink(config_file)
+            utils.clear_config_cache()
+
+    def test_openssh_hostname(self):
+        config_file = os.path.sep.join([os.path.dirname(__file__),
+                                        str(uuid4())])
+        with open(config_file, 'w') as fh:
+            fh.write("Host test\n  HostName 127.0.0.1\n")
+        try:
+            self.assertEqual(utils.read_openssh_hostname(
+                'test', config_file=config_file), '127.0.0.1')
+            self.assertEqual(utils.read_openssh_hostname(
+                'other', config_file=config_file), 'other')
+            self.assertEqual(utils.read_openssh_hostname(
+                'test', config_file=str(uuid4())), 'test')
+        finally:
+            os.unlink(config_file)
+            utils.clear_config_cache()
+
+    def test_iter_lines(self):
+        chunks = [b'line one\r\nline ', b'two\r', b'\n  indented\n', b'last']
+        self.assertEqual(list(utils.iter_lines(chunks)),
+                         [b'line one', b'line two', b'  indented', b'last'])
+        self.assertEqual(list(utils.iter_lines(chunks, keepends=True)),
+                         [b'line one\r\n', b'line two\r\n',
+                          b'  indented\n', b'last'])
+        self.assertEqual(list(utils.iter_lines([])), [])